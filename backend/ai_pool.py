@@ -0,0 +1,243 @@
+"""
+Process pool for AI searches.
+
+An expert search can hold a CPU for seconds; running it inline in /play_ai
+would block the GIL for every other game served by the same process. The
+pool receives a snapshot of the position, runs `Game.ai_move` in a worker
+process and hands the move back to the awaiting request.
+
+With AI_PARALLEL_WORKERS > 1 the expert search is split at the root instead:
+every iteration of the iterative deepening hands one slice of the root moves
+to each of N workers, which share their best score (alpha) through a manager
+process so a good move found by one worker prunes the others.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from bitboard import WIN_SCORE, coords
+from game import Game, PHASE_MOVEMENT, EXPERT_MAX_DEPTH, EXPERT_TIME_BUDGET
+from search import Searcher, SearchTimeout, INF, TT
+
+logger = logging.getLogger("mon_board")
+
+# Number of worker processes, 0 runs searches in a thread of this process instead
+AI_WORKERS = int(os.environ.get("AI_WORKERS", os.cpu_count() or 1))
+# Seconds to wait for a worker before falling back to the greedy move
+AI_MOVE_TIMEOUT = float(os.environ.get("AI_MOVE_TIMEOUT", EXPERT_TIME_BUDGET * 2 + 5))
+# Workers sharing one expert search (root splitting), 1 = one worker per search
+AI_PARALLEL_WORKERS = int(os.environ.get("AI_PARALLEL_WORKERS", 1))
+
+# Levels cheap enough to answer inline without a round trip to a worker
+INLINE_LEVELS = ("novice", "initie")
+# Levels searched in a thread of this process: they keep state on the Game between turns.
+# Such a search holds the GIL, slowing every request of this process while it runs, so
+# the scheduler runs at most AI_THREAD_SEARCHES of them at once (outside the worker slots).
+THREAD_LEVELS = ("mcts",)
+AI_THREAD_SEARCHES = int(os.environ.get("AI_THREAD_SEARCHES", 1))
+
+
+def snapshot(game):
+    """Binary snapshot of the game for a worker (the event log is left out)."""
+    return game.to_bytes(events=False)
+
+
+def restore(snap):
+    return Game.from_bytes(snap)
+
+
+def _table():
+    """(pid, stats) of this process's transposition table, sent back with every result."""
+    return os.getpid(), TT.stats()
+
+
+def _search(snap, player):
+    """Worker entry point: returns (move, search stats, table stats)."""
+    game = restore(snap)
+    return game.ai_move(player), game.last_search, _table()
+
+
+def _search_in_place(game, player):
+    return game.ai_move(player), game.last_search, _table()
+
+
+class SharedAlpha:
+    """Best root score found so far, shared by the workers of one search."""
+
+    def __init__(self, manager):
+        self.value = manager.Value("d", -INF)
+        self.lock = manager.Lock()
+
+    def get(self):
+        return self.value.value
+
+    def raise_to(self, score):
+        with self.lock:
+            if score > self.value.value:
+                self.value.value = score
+
+
+def _search_slice(snap, player, moves, depth, deadline, shared_alpha):
+    """
+    Worker entry point for root splitting: search `moves` at `depth`.
+    `deadline` is a time.time() value (None for no limit).
+    """
+    game = restore(snap)
+    bb = game.bb
+    searcher = Searcher(player)
+    searcher.tt.new_search()
+    if deadline is not None:
+        searcher.deadline = time.perf_counter() + (deadline - time.time())
+    try:
+        move, score = searcher.search_root(bb, depth, game.recent_positions, moves, shared_alpha)
+        complete = True
+    except SearchTimeout:
+        move, score, complete = None, None, False
+    return {
+        "move": move,
+        "score": score,
+        "scores": searcher.root_scores,
+        "exact": list(searcher.root_exact),
+        "nodes": searcher.nodes,
+        "complete": complete,
+        "table": _table(),
+    }
+
+
+class AIPool:
+    def __init__(self, workers=AI_WORKERS, timeout=AI_MOVE_TIMEOUT, parallel=AI_PARALLEL_WORKERS):
+        self.workers = workers
+        self.timeout = timeout
+        self.parallel = min(parallel, workers)
+        self._executor = None
+        self._manager = None
+        self.tables = {} # worker pid -> stats of its transposition table after its last search
+
+    def _get_executor(self):
+        # Created on first use so importing the module never forks
+        if self._executor is None and self.workers > 0:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def _get_manager(self):
+        if self._manager is None:
+            self._manager = multiprocessing.get_context("spawn").Manager()
+        return self._manager
+
+    async def search(self, game, player, timeout=None):
+        """Run the search in the workers, waiting at most `timeout` seconds (default: the pool's)."""
+        timeout = self.timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        if game.ai_difficulty in THREAD_LEVELS:
+            search = loop.run_in_executor(None, _search_in_place, game, player)
+        elif self.parallel > 1:
+            search = self._parallel_search(game, player)
+        else:
+            search = loop.run_in_executor(self._get_executor(), _search, snapshot(game), player)
+        try:
+            move, stats, table = await asyncio.wait_for(search, timeout)
+        except asyncio.TimeoutError:
+            logger.warning("AI search timed out after %ss, playing greedy move", timeout)
+            return self.fallback(game, player)
+        except BrokenProcessPool:
+            logger.exception("AI worker died, restarting pool")
+            self.shutdown()
+            return self.fallback(game, player)
+        if table is not None:
+            self.tables[table[0]] = table[1]
+        game.last_search = stats
+        return move
+
+    def table_stats(self):
+        """Transposition table counters summed over the workers (each has its own table)."""
+        total = {k: 0 for k in ("size", "used", "hits", "misses", "collisions", "stores", "overwrites")}
+        for stats in list(self.tables.values()):
+            for k in total:
+                total[k] += stats[k]
+        probes = total["hits"] + total["misses"] + total["collisions"]
+        total["fill"] = total["used"] / total["size"] if total["size"] else 0.0
+        total["hit_rate"] = total["hits"] / probes if probes else 0.0
+        total["workers"] = len(self.tables)
+        return total
+
+    async def _parallel_search(self, game, player):
+        """Iterative deepening with the root moves of every iteration split over workers."""
+        book = game.book_move(player)
+        if book is not None:
+            return book, game.last_search, None
+
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        manager = self._get_manager()
+        snap = snapshot(game)
+        bb = game.bb.copy()
+
+        moves = bb.moves(player)
+        if not moves: return None, None, None
+        Searcher(player).order_moves(bb, moves, player, 0)
+
+        start = time.time()
+        deadline = start + EXPERT_TIME_BUDGET if EXPERT_TIME_BUDGET else None
+        best_move, best_depth, nodes = None, 0, 0
+        for depth in range(1, EXPERT_MAX_DEPTH + 1):
+            if depth > 1 and deadline is not None and time.time() >= deadline:
+                break
+            shared_alpha = SharedAlpha(manager)
+            # Deal the moves round-robin so every worker starts with a good one
+            slices = [moves[i::self.parallel] for i in range(self.parallel)]
+            results = await asyncio.gather(*(
+                loop.run_in_executor(executor, _search_slice, snap, player, s, depth,
+                                     deadline if depth > 1 else None, shared_alpha)
+                for s in slices if s
+            ))
+            nodes += sum(r["nodes"] for r in results)
+            self.tables.update(r["table"] for r in results)
+            if not all(r["complete"] for r in results):
+                break
+            scores, exact = {}, {}
+            for r in results:
+                scores.update(r["scores"])
+                exact.update((m, r["scores"][m]) for m in r["exact"])
+            # A move that failed low against another worker's alpha can come back with
+            # that alpha as its bound: only exact scores may pick the move to play
+            best = max(moves, key=lambda m: exact.get(m, -INF))
+            moves.sort(key=scores.get, reverse=True)
+            moves.remove(best)
+            moves.insert(0, best)
+            best_move, best_depth = best, depth
+            if abs(scores[best_move]) >= WIN_SCORE:
+                break
+
+        elapsed = time.time() - start
+        stats = {
+            "nodes": nodes,
+            "depth": best_depth,
+            "time": round(elapsed, 4),
+            "nps": int(nodes / elapsed) if elapsed else 0,
+            "workers": self.parallel,
+        }
+        return {"from": coords(best_move[0]), "to": coords(best_move[1])}, stats, None
+
+    def fallback(self, game, player):
+        """The greedy level's move, for when no search result can be had in time."""
+        if game.phase != PHASE_MOVEMENT:
+            return game.ai_move(player)
+        return game.greedy_move(player)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+
+pool = AIPool()
@@ -0,0 +1,195 @@
+"""
+Headless self-play arena and engine benchmark.
+
+Plays seeded games between AI levels in-process (no HTTP) and reports win
+rates, search speed, move times and memory, e.g.
+
+    python arena.py novice initie expert --games 200 --depth 3
+    python arena.py initie expert --games 1000 --full --jobs 8 --json results.json
+    python arena.py expert mcts --games 50 --time 0.5 --mcts-time 0.5
+
+Every pair of levels plays `--games` games, colours alternating. Games use
+fast mode by default, `--full` plays the placement phase too. Any level
+accepted by Game.ai_move can be named, so new engines show up here as soon
+as they exist.
+"""
+import argparse
+import json
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+
+import game as game_module
+from bitboard import WHITE, BLACK
+from game import Game, PHASE_PLACEMENT
+from search import TT
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+MAX_MOVES = 300 # movement phase moves before a game is called a draw
+
+
+def play_game(white, black, seed, fast=True, max_moves=MAX_MOVES):
+    """
+    Play one game between two levels. Returns {"winner": WHITE|BLACK|None,
+    "moves": n, "times": {level: [seconds per move]}, "nodes": {level: n}}.
+    """
+    random.seed(seed)
+    game = Game()
+    if fast:
+        game.setup_fast_mode()
+    levels = {WHITE: white, BLACK: black}
+    times = {white: [], black: []}
+    nodes = {white: 0, black: 0}
+    moves = 0
+    winner = None
+    while moves < max_moves:
+        player = game.current
+        level = levels[player]
+        game.ai_difficulty = level
+        game.last_search = None
+        start = time.perf_counter()
+        mv = game.ai_move(player)
+        times[level].append(time.perf_counter() - start)
+        if game.last_search:
+            nodes[level] += game.last_search["nodes"]
+        if mv is None:
+            # No legal move: the game is stuck, counted as a draw
+            break
+        if game.phase == PHASE_PLACEMENT:
+            game.play(*mv)
+        else:
+            game.move_piece(*mv["from"], *mv["to"])
+            moves += 1
+            winner = game.check_winner()
+            if winner is not None:
+                break
+    return {"winner": winner, "moves": moves, "times": times, "nodes": nodes}
+
+
+def _play(args):
+    return play_game(*args)
+
+
+def configure(depth=None, time_budget=None, node_budget=None, mcts_time=None, mcts_iterations=None):
+    """Override the expert / MCTS search limits (ai_move reads them on every call)."""
+    if depth is not None: game_module.EXPERT_MAX_DEPTH = depth
+    if time_budget is not None: game_module.EXPERT_TIME_BUDGET = time_budget
+    if node_budget is not None: game_module.EXPERT_NODE_BUDGET = node_budget
+    if mcts_time is not None: game_module.MCTS_TIME_BUDGET = mcts_time
+    if mcts_iterations is not None: game_module.MCTS_ITERATIONS = mcts_iterations
+
+
+def _percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run_match(a, b, games, seed=0, fast=True, max_moves=MAX_MOVES, executor=None):
+    """
+    `games` games between levels a and b, colours alternating, spread over
+    `executor` when given. Returns the per-level summary.
+    """
+    stats = {level: {"wins": 0, "times": [], "nodes": 0} for level in (a, b)}
+    draws = 0
+    jobs = [((a, b) if i % 2 == 0 else (b, a)) + (seed + i, fast, max_moves) for i in range(games)]
+    results = executor.map(_play, jobs, chunksize=8) if executor else map(_play, jobs)
+    for (white, black, *_), result in zip(jobs, results):
+        if result["winner"] is None:
+            draws += 1
+        else:
+            stats[white if result["winner"] == WHITE else black]["wins"] += 1
+        for level in (a, b):
+            stats[level]["times"] += result["times"][level]
+            stats[level]["nodes"] += result["nodes"][level]
+    summary = {"games": games, "draws": draws, "levels": {}}
+    for level, s in stats.items():
+        total = sum(s["times"])
+        summary["levels"][level] = {
+            "win_rate": s["wins"] / games if games else 0.0,
+            "moves": len(s["times"]),
+            "avg_move_ms": 1000 * total / len(s["times"]) if s["times"] else 0.0,
+            "p99_move_ms": 1000 * _percentile(s["times"], 0.99),
+            "nodes": s["nodes"],
+            "nps": int(s["nodes"] / total) if total else 0,
+        }
+    return summary
+
+
+def peak_memory_mb():
+    """Peak resident set size of this process (None where unavailable)."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(usage, children) / 1024, 1) # kB on Linux
+
+
+def run_arena(levels, games, seed=0, fast=True, max_moves=MAX_MOVES, jobs=1, limits=()):
+    """Every pair of `levels` plays a match; `limits` are configure() arguments."""
+    configure(*limits)
+    executor = ProcessPoolExecutor(jobs, initializer=configure, initargs=tuple(limits)) if jobs > 1 else None
+    start = time.perf_counter()
+    matches = []
+    try:
+        for a, b in combinations(levels, 2):
+            summary = run_match(a, b, games, seed, fast, max_moves, executor)
+            summary["pair"] = [a, b]
+            matches.append(summary)
+    finally:
+        if executor:
+            executor.shutdown()
+    return {
+        "matches": matches,
+        "elapsed": round(time.perf_counter() - start, 2),
+        "jobs": jobs,
+        "peak_memory_mb": peak_memory_mb(),
+        # Only this process's table: with --jobs the searches ran in the workers
+        "transposition_table": TT.stats(),
+    }
+
+
+def print_report(report):
+    for m in report["matches"]:
+        a, b = m["pair"]
+        print(f"\n{a} vs {b}: {m['games']} games, {m['draws']} draws")
+        print(f"  {'level':<10}{'win %':>8}{'moves':>8}{'avg ms':>10}{'p99 ms':>10}{'nps':>10}")
+        for level, s in m["levels"].items():
+            print(f"  {level:<10}{100 * s['win_rate']:>8.1f}{s['moves']:>8}"
+                  f"{s['avg_move_ms']:>10.2f}{s['p99_move_ms']:>10.2f}{s['nps']:>10}")
+    print(f"\n{report['elapsed']}s on {report['jobs']} job(s), peak memory {report['peak_memory_mb']} MB, "
+          f"TT hit rate {report['transposition_table']['hit_rate']:.2%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Self-play arena between AI levels")
+    parser.add_argument("levels", nargs="+", help="AI levels, e.g. novice initie expert")
+    parser.add_argument("--games", type=int, default=100, help="games per pair of levels")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--full", action="store_true", help="play the placement phase instead of fast mode")
+    parser.add_argument("--max-moves", type=int, default=MAX_MOVES)
+    parser.add_argument("--depth", type=int, help="expert max depth (AI_MAX_DEPTH)")
+    parser.add_argument("--time", type=float, help="expert time budget per move in seconds (AI_TIME_BUDGET)")
+    parser.add_argument("--nodes", type=int, help="expert node budget per move (AI_NODE_BUDGET)")
+    parser.add_argument("--mcts-time", type=float, help="mcts time budget per move in seconds (AI_MCTS_TIME_BUDGET)")
+    parser.add_argument("--mcts-iterations", type=int, help="mcts playouts per move (AI_MCTS_ITERATIONS)")
+    parser.add_argument("--jobs", type=int, default=1, help="worker processes")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = run_arena(args.levels, args.games, args.seed, not args.full, args.max_moves,
+                       args.jobs, (args.depth, args.time, args.nodes, args.mcts_time, args.mcts_iterations))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Batched evaluation with NumPy.
+
+Scores many positions in one call: the boards are stacked into an
+(N, 9, 9) int8 array (EMPTY / WHITE / BLACK) and every evaluation term of
+Bitboard.evaluate is computed for all of them at once:
+
+    counts      pieces of each colour
+    adjacency   enemies around every cell, as shifted sums of the 3x3 window
+    danger      THREAT of every piece's enemy count, summed
+    centre      CENTER_BONUS summed over the pieces
+    captures    opponent pieces next to the moved piece with 3+ enemies around
+
+Used to rank the human's likely replies by their evaluation (pondering).
+NumPy is optional: without it AVAILABLE is False and callers keep the
+per-move Bitboard path, which gives the same results.
+"""
+from bitboard import EMPTY, WHITE, BLACK, SIZE, CELLS, WIN_SCORE, THREAT, CENTER_BONUS, OTHER
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+AVAILABLE = np is not None
+
+_BYTES = (CELLS + 7) // 8
+
+if AVAILABLE:
+    _THREAT = np.array(THREAT, dtype=np.int64)
+    _CENTER = np.array(CENTER_BONUS, dtype=np.int64).reshape(SIZE, SIZE)
+    # (dx, dy) of the 8 neighbours
+    _OFFSETS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+
+
+def _unpack(masks):
+    """(N, 9, 9) bool array of the bits of N 81-bit ints (bit x * 9 + y is cell (x, y))."""
+    raw = b"".join(m.to_bytes(_BYTES, "little") for m in masks)
+    bits = np.unpackbits(np.frombuffer(raw, dtype=np.uint8).reshape(-1, _BYTES), axis=1, bitorder="little")
+    return bits[:, :CELLS].reshape(-1, SIZE, SIZE).astype(bool)
+
+
+def stack(bitboards):
+    """(N, 9, 9) int8 array of the given bitboards."""
+    white = _unpack([bb.pieces[WHITE] for bb in bitboards])
+    black = _unpack([bb.pieces[BLACK] for bb in bitboards])
+    return (white * WHITE + black * BLACK).astype(np.int8)
+
+
+def neighbour_counts(boards, colour):
+    """(N, 9, 9) number of `colour` pieces around every cell."""
+    mine = np.zeros((boards.shape[0], SIZE + 2, SIZE + 2), dtype=np.int8)
+    mine[:, 1:-1, 1:-1] = boards == colour
+    counts = np.zeros(boards.shape, dtype=np.int8)
+    for dx, dy in _OFFSETS:
+        counts += mine[:, 1 + dx:1 + dx + SIZE, 1 + dy:1 + dy + SIZE]
+    return counts
+
+
+def evaluate(boards, player):
+    """Bitboard.evaluate(player) of every board, as an int64 array."""
+    opponent = OTHER[player]
+    mine = boards == player
+    theirs = boards == opponent
+    p_count = mine.sum(axis=(1, 2), dtype=np.int64)
+    o_count = theirs.sum(axis=(1, 2), dtype=np.int64)
+    # Danger of a side: THREAT of the number of enemies around each of its pieces
+    p_danger = np.where(mine, _THREAT[neighbour_counts(boards, opponent)], 0).sum(axis=(1, 2))
+    o_danger = np.where(theirs, _THREAT[neighbour_counts(boards, player)], 0).sum(axis=(1, 2))
+    center = np.where(mine, _CENTER, 0).sum(axis=(1, 2))
+    scores = (p_count - o_count) * 1000 + o_danger - p_danger + center
+    scores = np.where(p_count < 3, -WIN_SCORE, scores)
+    return np.where(o_count < 3, WIN_SCORE, scores)
+
+
+def capture_sets(boards, player, to):
+    """
+    (N, 9, 9) bool mask of the pieces `player` captures by having just moved
+    to square to[i] on boards[i]: opponent pieces next to it with at least 3
+    `player` pieces around them.
+    """
+    x, y = np.divmod(np.asarray(to), SIZE)
+    gx, gy = np.ogrid[:SIZE, :SIZE]
+    near = (np.abs(gx - x[:, None, None]) <= 1) & (np.abs(gy - y[:, None, None]) <= 1)
+    return near & (boards == OTHER[player]) & (neighbour_counts(boards, player) >= 3)
+
+
+def children(bb, player, moves=None):
+    """
+    Boards after each of `moves` (default: every legal move of `player`),
+    captures applied. Returns (moves, boards, captured counts).
+    """
+    if moves is None:
+        moves = bb.moves(player)
+    n = len(moves)
+    if not n:
+        return moves, np.zeros((0, SIZE, SIZE), dtype=np.int8), np.zeros(0, dtype=np.int64)
+    frm, to = np.array(moves).T
+    boards = np.repeat(stack([bb]), n, axis=0)
+    flat = boards.reshape(n, CELLS)
+    rows = np.arange(n)
+    flat[rows, frm] = EMPTY
+    flat[rows, to] = player
+    captured = capture_sets(boards, player, to)
+    boards[captured] = EMPTY
+    return moves, boards, captured.sum(axis=(1, 2), dtype=np.int64)
+
+
+def score_moves(bb, player, moves=None):
+    """(moves, captured counts, evaluations for `player`) of every move, in one batch."""
+    moves, boards, captured = children(bb, player, moves)
+    return moves, captured, evaluate(boards, player)
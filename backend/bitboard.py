@@ -0,0 +1,321 @@
+"""
+Bitboard engine for the 9x9 board.
+
+Each colour is stored as one 81-bit integer where bit ``x * 9 + y`` is set when
+that colour owns cell (x, y). Neighbour masks are precomputed once per square so
+captures, move generation and evaluation become mask intersections and
+popcounts instead of nested loops with bounds checks.
+
+A Zobrist hash of the pieces is kept up to date by every place/move/capture
+and undo, so the search can key its transposition table on it for free.
+
+The evaluation terms (piece counts, enemy neighbours of every cell, threat
+and centre scores) are maintained the same way, each update only touching
+the 8 cells around the square that changed, so evaluating a leaf is a few
+lookups.
+"""
+import random
+
+EMPTY = 0
+WHITE = 1
+BLACK = 2
+
+SIZE = 9
+CELLS = SIZE * SIZE
+FULL = (1 << CELLS) - 1
+
+WIN_SCORE = 100000
+
+
+def square(x, y):
+    return x * SIZE + y
+
+
+def coords(sq):
+    return divmod(sq, SIZE)
+
+
+def other(player):
+    return BLACK if player == WHITE else WHITE
+
+
+def iter_bits(mask):
+    """Yield the square index of every set bit, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _build_neighbours():
+    masks = []
+    for x in range(SIZE):
+        for y in range(SIZE):
+            m = 0
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    if dx == 0 and dy == 0:
+                        continue
+                    nx, ny = x + dx, y + dy
+                    if 0 <= nx < SIZE and 0 <= ny < SIZE:
+                        m |= 1 << square(nx, ny)
+            masks.append(m)
+    return masks
+
+
+# 8-neighbourhood of every square, as a mask and as a list of squares
+NEIGHBOURS = _build_neighbours()
+NEIGHBOUR_LIST = [list(iter_bits(m)) for m in NEIGHBOURS]
+# Reachability tables of the 1-2 step move: STEP1[sq] is the 1-step mask,
+# STEP2[sq] the (via, targets) pairs where targets are the cells one step
+# past `via` (sq excluded). A target is reachable when `via` is empty.
+STEP1 = NEIGHBOURS
+STEP2 = [tuple((via, NEIGHBOURS[via] & ~(1 << sq)) for via in NEIGHBOUR_LIST[sq]) for sq in range(SIZE * SIZE)]
+# Danger of a piece by number of adjacent enemies: 2 puts it in danger
+# (3 are needed to capture), 3+ means it is about to fall
+THREAT = [0, 0, 50, 200, 200, 200, 200, 200, 200]
+OTHER = (EMPTY, BLACK, WHITE)
+# Centre bonus used by the evaluation (8 - manhattan distance to the centre)
+CENTER_BONUS = [8 - (abs(x - 4) + abs(y - 4)) for x in range(SIZE) for y in range(SIZE)]
+
+# Zobrist keys. Fixed seed so hashes are identical across processes and restarts.
+_rng = random.Random(0x8702)
+ZOBRIST = [
+    [0] * CELLS,
+    [_rng.getrandbits(64) for _ in range(CELLS)],
+    [_rng.getrandbits(64) for _ in range(CELLS)],
+]
+# Side to move, XORed in when BLACK is to move
+ZOBRIST_SIDE = _rng.getrandbits(64)
+
+
+class Bitboard:
+    __slots__ = ("pieces", "hash", "counts", "adj", "danger", "center")
+
+    def __init__(self, white=0, black=0):
+        # Indexed by colour so pieces[WHITE] / pieces[BLACK] work directly
+        self.pieces = [0, 0, 0]
+        self.hash = 0
+        self.counts = [0, 0, 0]
+        # adj[c][sq]: number of `c` pieces around sq
+        self.adj = [None, [0] * CELLS, [0] * CELLS]
+        # danger[c]: sum of THREAT over the pieces of `c`
+        self.danger = [0, 0, 0]
+        # center[c]: sum of CENTER_BONUS over the pieces of `c`
+        self.center = [0, 0, 0]
+        for sq in iter_bits(white):
+            self.place(WHITE, sq)
+        for sq in iter_bits(black):
+            self.place(BLACK, sq)
+
+    @classmethod
+    def from_rows(cls, rows):
+        bb = cls()
+        for x in range(SIZE):
+            for y in range(SIZE):
+                cell = rows[x][y]
+                if cell != EMPTY:
+                    bb.place(cell, square(x, y))
+        return bb
+
+    def to_rows(self):
+        white, black = self.pieces[WHITE], self.pieces[BLACK]
+        rows = []
+        for x in range(SIZE):
+            row = []
+            base = x * SIZE
+            for y in range(SIZE):
+                bit = 1 << (base + y)
+                row.append(WHITE if white & bit else BLACK if black & bit else EMPTY)
+            rows.append(row)
+        return rows
+
+    def copy(self):
+        bb = Bitboard.__new__(Bitboard)
+        bb.pieces = self.pieces[:]
+        bb.hash = self.hash
+        bb.counts = self.counts[:]
+        bb.adj = [None, self.adj[WHITE][:], self.adj[BLACK][:]]
+        bb.danger = self.danger[:]
+        bb.center = self.center[:]
+        return bb
+
+    def snapshot(self):
+        return (self.pieces[WHITE], self.pieces[BLACK])
+
+    def key(self, side):
+        """Zobrist key of (position, side to move)."""
+        return self.hash ^ ZOBRIST_SIDE if side == BLACK else self.hash
+
+    # --- Queries ---
+
+    def occupied(self):
+        return self.pieces[WHITE] | self.pieces[BLACK]
+
+    def empty(self):
+        return ~(self.pieces[WHITE] | self.pieces[BLACK]) & FULL
+
+    def get(self, sq):
+        bit = 1 << sq
+        if self.pieces[WHITE] & bit: return WHITE
+        if self.pieces[BLACK] & bit: return BLACK
+        return EMPTY
+
+    def count(self, player):
+        return self.counts[player]
+
+    def winner(self):
+        """Winner by material (the side left with fewer than 3 pieces loses)."""
+        w = self.counts[WHITE]
+        b = self.counts[BLACK]
+        if w < 3 and b >= 3: return BLACK
+        if b < 3 and w >= 3: return WHITE
+        return None
+
+    def captures(self, sq, player):
+        """
+        Mask of opponent pieces captured once `player` stands on `sq`: every
+        adjacent opponent piece with at least 3 `player` pieces around it.
+        """
+        around = self.adj[player]
+        captured = 0
+        for o in iter_bits(NEIGHBOURS[sq] & self.pieces[OTHER[player]]):
+            if around[o] >= 3:
+                captured |= 1 << o
+        return captured
+
+    def move_captures(self, player, frm, to):
+        """Mask `captures` would return after moving frm -> to, without making the move."""
+        around = self.adj[player]
+        captured = 0
+        for o in iter_bits(NEIGHBOURS[to] & self.pieces[OTHER[player]]):
+            # `to` is next to o by construction, `frm` may be as well
+            if around[o] + 1 - (NEIGHBOURS[o] >> frm & 1) >= 3:
+                captured |= 1 << o
+        return captured
+
+    def destinations(self, sq, empty=None):
+        """
+        Cells reachable from `sq` in 1 or 2 steps through empty cells. The
+        one move generator: validation, /valid_moves and the AI all use it.
+        """
+        if empty is None:
+            empty = self.empty()
+        dest = STEP1[sq]
+        for via, targets in STEP2[sq]:
+            if empty >> via & 1:
+                dest |= targets
+        return dest & empty
+
+    def moves(self, player):
+        """All (from_sq, to_sq) moves for `player`, in board-scan order."""
+        empty = self.empty()
+        out = []
+        append = out.append
+        mine = self.pieces[player]
+        while mine:
+            low = mine & -mine
+            f = low.bit_length() - 1
+            mine ^= low
+            # destinations() inlined, this runs at every node of the search
+            dest = STEP1[f]
+            for via, targets in STEP2[f]:
+                if empty >> via & 1:
+                    dest |= targets
+            dest &= empty
+            while dest:
+                low = dest & -dest
+                append((f, low.bit_length() - 1))
+                dest ^= low
+        return out
+
+    def capture_moves(self, player):
+        """
+        The moves of `player` that capture something. A capture needs an
+        opponent piece with 2+ of our pieces around it already, so only the
+        empty cells next to those are tried as destinations.
+        """
+        around = self.adj[player]
+        targets = 0
+        for o in iter_bits(self.pieces[OTHER[player]]):
+            if around[o] >= 2:
+                targets |= NEIGHBOURS[o]
+        empty = self.empty()
+        targets &= empty
+        out = []
+        if not targets:
+            return out
+        for f in iter_bits(self.pieces[player]):
+            for t in iter_bits(self.destinations(f, empty) & targets):
+                if self.move_captures(player, f, t):
+                    out.append((f, t))
+        return out
+
+    # --- Make / unmake ---
+
+    def place(self, player, sq):
+        opp = OTHER[player]
+        self.pieces[player] |= 1 << sq
+        self.hash ^= ZOBRIST[player][sq]
+        self.counts[player] += 1
+        self.center[player] += CENTER_BONUS[sq]
+        self.danger[player] += THREAT[self.adj[opp][sq]]
+        # The new piece is one more enemy around every neighbouring opponent piece
+        around = self.adj[player]
+        theirs = self.pieces[opp]
+        delta = 0
+        for n in NEIGHBOUR_LIST[sq]:
+            k = around[n]
+            around[n] = k + 1
+            if theirs >> n & 1:
+                delta += THREAT[k + 1] - THREAT[k]
+        self.danger[opp] += delta
+
+    def remove(self, player, sq):
+        opp = OTHER[player]
+        self.pieces[player] &= ~(1 << sq)
+        self.hash ^= ZOBRIST[player][sq]
+        self.counts[player] -= 1
+        self.center[player] -= CENTER_BONUS[sq]
+        self.danger[player] -= THREAT[self.adj[opp][sq]]
+        around = self.adj[player]
+        theirs = self.pieces[opp]
+        delta = 0
+        for n in NEIGHBOUR_LIST[sq]:
+            k = around[n]
+            around[n] = k - 1
+            if theirs >> n & 1:
+                delta += THREAT[k - 1] - THREAT[k]
+        self.danger[opp] += delta
+
+    def make_move(self, player, frm, to):
+        """Move a piece and apply captures. Returns the captured mask for unmake."""
+        self.remove(player, frm)
+        self.place(player, to)
+        captured = self.captures(to, player)
+        if captured:
+            opp = OTHER[player]
+            for sq in iter_bits(captured):
+                self.remove(opp, sq)
+        return captured
+
+    def unmake_move(self, player, frm, to, captured):
+        if captured:
+            opp = OTHER[player]
+            for sq in iter_bits(captured):
+                self.place(opp, sq)
+        self.remove(player, to)
+        self.place(player, frm)
+
+    # --- Evaluation ---
+
+    def evaluate(self, player):
+        opponent = OTHER[player]
+        p_count = self.counts[player]
+        o_count = self.counts[opponent]
+
+        if o_count < 3: return WIN_SCORE
+        if p_count < 3: return -WIN_SCORE
+
+        threat_score = self.danger[opponent] - self.danger[player]
+        return (p_count - o_count) * 1000 + threat_score + self.center[player]
@@ -0,0 +1,249 @@
+"""
+Opening and endgame book for the expert AI.
+
+The book is a file of fixed 16-byte records sorted by position key, mapped
+into memory and binary searched, so every worker process shares the same
+pages and a probe costs ~log2(n) key reads:
+
+    header   magic "8TBK", format, record count, reserved        (16 bytes)
+    record   key (Q), move (H), score (i), padding                (16 bytes)
+
+The key is the Zobrist key of (position, side to move), XORed with
+PLACEMENT_KEY during the placement phase. A move is from * 81 + to, or
+81 * 81 + square for a placement.
+
+Built offline (python book.py --out book.bin):
+  - placement: the empty board and every first placement, answered with a
+    two-ply lookahead on the evaluation terms (centre, danger);
+  - endgame: positions with few pieces left (10 by default), sampled from
+    seeded greedy self-play and solved with a deeper search than the live
+    budget.
+Every entry is stored under the 8 symmetries of the board.
+
+A full endgame tablebase is out of reach here: even 3 against 3 pieces is
+billions of positions on 81 cells, so the endgame part only covers the
+sampled positions (and their symmetries).
+"""
+import argparse
+import mmap
+import os
+import random
+import struct
+
+from bitboard import Bitboard, WHITE, BLACK, SIZE, CELLS, WIN_SCORE, square, coords, iter_bits, other
+from search import Searcher, TranspositionTable
+
+BOOK_PATH = os.environ.get("AI_BOOK", os.path.join(os.path.dirname(__file__), "book.bin"))
+
+MAGIC = b"8TBK"
+FORMAT = 1
+_HEADER = struct.Struct("<4sIII")
+_RECORD = struct.Struct("<QHixx")
+_KEY = struct.Struct("<Q")
+PLACEMENT_KEY = 0x9E3779B97F4A7C15 # keeps placement entries apart from movement ones
+PLACE = CELLS * CELLS # moves >= PLACE are placements
+
+
+def _symmetries():
+    maps = []
+    for transform in (
+        lambda x, y: (x, y), lambda x, y: (y, SIZE - 1 - x),
+        lambda x, y: (SIZE - 1 - x, SIZE - 1 - y), lambda x, y: (SIZE - 1 - y, x),
+        lambda x, y: (x, SIZE - 1 - y), lambda x, y: (SIZE - 1 - x, y),
+        lambda x, y: (y, x), lambda x, y: (SIZE - 1 - y, SIZE - 1 - x),
+    ):
+        maps.append([square(*transform(*coords(sq))) for sq in range(CELLS)])
+    return maps
+
+
+# SYMMETRIES[k][sq]: image of sq under the k-th rotation / reflection
+SYMMETRIES = _symmetries()
+
+
+def book_key(bb, side, placement=False):
+    key = bb.key(side)
+    return key ^ PLACEMENT_KEY if placement else key
+
+
+class Book:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, fmt, self.count, _ = _HEADER.unpack_from(self.data)
+        if magic != MAGIC or fmt != FORMAT:
+            raise ValueError(f"{path} is not a book file")
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key):
+        """(move, score) stored for `key`, or None."""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            k, = _KEY.unpack_from(self.data, _HEADER.size + mid * _RECORD.size)
+            if k < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count:
+            key_found, move, score = _RECORD.unpack_from(self.data, _HEADER.size + lo * _RECORD.size)
+            if key_found == key:
+                self.hits += 1
+                return move, score
+        self.misses += 1
+        return None
+
+    def probe(self, bb, side, placement=False):
+        """Book move for `side`: a square when placing, a (from, to) pair when moving, or None."""
+        hit = self.lookup(book_key(bb, side, placement))
+        if hit is None:
+            return None
+        move = hit[0]
+        if placement:
+            return move - PLACE if move >= PLACE else None
+        return divmod(move, CELLS) if move < PLACE else None
+
+    def stats(self):
+        return {"entries": self.count, "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        self.data.close()
+
+
+def open_book(path=BOOK_PATH):
+    """The book at `path`, or None when there is none (the AI then always searches)."""
+    if not path or not os.path.exists(path):
+        return None
+    return Book(path)
+
+
+def write_book(path, entries):
+    """entries: {key: (move, score)}."""
+    keys = sorted(entries)
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT, len(keys), 0))
+        for key in keys:
+            move, score = entries[key]
+            f.write(_RECORD.pack(key, move, max(-WIN_SCORE, min(WIN_SCORE, int(score)))))
+
+
+# --- Offline generation ---
+
+def _add(entries, bb, side, move, score, placement=False):
+    """Store the entry under every symmetry of the board."""
+    for sym in SYMMETRIES:
+        image = Bitboard(
+            sum(1 << sym[sq] for sq in iter_bits(bb.pieces[WHITE])),
+            sum(1 << sym[sq] for sq in iter_bits(bb.pieces[BLACK])))
+        if placement:
+            mapped = PLACE + sym[move]
+        else:
+            mapped = sym[move[0]] * CELLS + sym[move[1]]
+        entries[book_key(image, side, placement)] = (mapped, score)
+
+
+def _placement_score(bb, player):
+    opp = other(player)
+    return bb.center[player] - bb.center[opp] + bb.danger[opp] - bb.danger[player]
+
+
+def best_placement(bb, player):
+    """Two-ply lookahead: the square whose worst opponent reply leaves the best evaluation."""
+    best, best_score = None, None
+    opp = other(player)
+    for sq in iter_bits(bb.empty()):
+        bb.place(player, sq)
+        worst = None
+        for reply in iter_bits(bb.empty()):
+            bb.place(opp, reply)
+            score = _placement_score(bb, player)
+            bb.remove(opp, reply)
+            if worst is None or score < worst:
+                worst = score
+        bb.remove(player, sq)
+        if best_score is None or worst > best_score:
+            best, best_score = sq, worst
+    return best, best_score
+
+
+def build_placement(entries):
+    empty = Bitboard()
+    move, score = best_placement(empty, WHITE)
+    _add(entries, empty, WHITE, move, score, placement=True)
+    for first in range(CELLS):
+        bb = Bitboard(1 << first, 0)
+        move, score = best_placement(bb, BLACK)
+        _add(entries, bb, BLACK, move, score, placement=True)
+
+
+def _greedy(bb, side, rng):
+    moves = bb.moves(side)
+    if not moves:
+        return None
+    best = max(bb.move_captures(side, f, t).bit_count() for f, t in moves)
+    return rng.choice([(f, t) for f, t in moves if bb.move_captures(side, f, t).bit_count() == best])
+
+
+def sample_endgames(games, max_pieces, seed=0, max_moves=300, pieces=18):
+    """Positions with at most `max_pieces` pieces on the board, from seeded greedy self-play."""
+    rng = random.Random(seed)
+    seen = set()
+    for _ in range(games):
+        cells = rng.sample(range(CELLS), 2 * pieces)
+        bb = Bitboard(sum(1 << sq for sq in cells[:pieces]), sum(1 << sq for sq in cells[pieces:]))
+        side = WHITE
+        for _ in range(max_moves):
+            if bb.winner() is not None:
+                break
+            if bb.count(WHITE) + bb.count(BLACK) <= max_pieces:
+                key = bb.key(side)
+                if key not in seen:
+                    seen.add(key)
+                    yield bb.copy(), side
+            move = _greedy(bb, side, rng)
+            if move is None:
+                break
+            bb.make_move(side, *move)
+            side = other(side)
+
+
+def build_endgame(entries, games, max_pieces, depth, min_depth, node_budget, limit, seed=0):
+    tt = TranspositionTable(1 << 16)
+    solved = 0
+    for bb, side in sample_endgames(games, max_pieces, seed):
+        tt.clear()
+        searcher = Searcher(side, tt)
+        move, score, reached = searcher.iterative_deepening(bb, depth, node_budget=node_budget)
+        # Only keep answers searched at least as deep as the live AI gets in its budget
+        if move is not None and (reached >= min_depth or abs(score) >= WIN_SCORE):
+            _add(entries, bb, side, move, score)
+            solved += 1
+            if solved >= limit:
+                break
+    return solved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the AI opening / endgame book")
+    parser.add_argument("--out", default=BOOK_PATH)
+    parser.add_argument("--games", type=int, default=200, help="self-play games sampled for endgames")
+    parser.add_argument("--pieces", type=int, default=10, help="endgame: at most this many pieces on the board")
+    parser.add_argument("--depth", type=int, default=5, help="search depth used to solve endgames")
+    parser.add_argument("--min-depth", type=int, default=4, help="drop answers that did not reach this depth")
+    parser.add_argument("--nodes", type=int, default=300000, help="node budget per endgame position")
+    parser.add_argument("--positions", type=int, default=2000, help="endgame positions to solve")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    entries = {}
+    build_placement(entries)
+    print(f"placement: {len(entries)} entries")
+    solved = build_endgame(entries, args.games, args.pieces, args.depth, args.min_depth,
+                           args.nodes, args.positions, args.seed)
+    print(f"endgame: {solved} positions solved")
+    write_book(args.out, entries)
+    print(f"{len(entries)} entries written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
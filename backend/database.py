@@ -1,57 +1,315 @@
 import sqlite3
 import os
+import bisect
+import itertools
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 
-DB_PATH = os.path.join(os.path.dirname(__file__), "scores.db")
+logger = logging.getLogger("mon_board")
+
+DB_PATH = os.environ.get("SCORES_DB", os.path.join(os.path.dirname(__file__), "scores.db"))
+
+# Readers share a small pool of connections; all writes go through one writer thread
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 4))
+# Group commit: the writer commits once it has this many rows or the oldest one waited this long
+SCORE_BATCH_ROWS = int(os.environ.get("SCORE_BATCH_ROWS", 100))
+SCORE_BATCH_MS = float(os.environ.get("SCORE_BATCH_MS", 50))
+# Durability: "1" makes add_score wait until its batch is committed (write-behind otherwise),
+# DB_SYNCHRONOUS is SQLite's fsync level (NORMAL is safe with WAL, FULL survives power loss)
+SCORE_DURABLE = os.environ.get("SCORE_DURABLE", "0") == "1"
+DB_SYNCHRONOUS = os.environ.get("DB_SYNCHRONOUS", "NORMAL")
+# Rows of the leaderboard kept in memory; requests for more than this go to SQLite
+LEADERBOARD_CACHE_SIZE = int(os.environ.get("LEADERBOARD_CACHE_SIZE", 100))
+# Seconds before the cached rows are reloaded, to pick up the scores other workers wrote
+LEADERBOARD_CACHE_TTL = float(os.environ.get("LEADERBOARD_CACHE_TTL", 5))
+
+_INSERT = """
+    INSERT INTO leaderboard (player_name, score_blue, score_orange, winner, date, best_score)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+_COLUMNS = ("player_name", "score_blue", "score_orange", "winner", "date")
+
+
+def _sort_key(entry):
+    # best_score DESC, date DESC, as an ascending key for bisect
+    return (-max(entry["score_blue"], entry["score_orange"]), _Desc(entry["date"]))
+
+
+class _Desc(str):
+    """String that sorts in reverse order."""
+    def __lt__(self, other):
+        return str.__gt__(self, other)
+
+    def __le__(self, other):
+        return str.__ge__(self, other)
+
+    def __gt__(self, other):
+        return str.__lt__(self, other)
+
+    def __ge__(self, other):
+        return str.__le__(self, other)
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+    return conn
+
+
+class ConnectionPool:
+    def __init__(self, path, size=DB_POOL_SIZE):
+        self.path = path
+        self.idle = queue.LifoQueue(maxsize=size)
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            conn = _connect(self.path)
+        try:
+            yield conn
+        finally:
+            try:
+                self.idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class _Done(threading.Event):
+    """Set once the row's batch is written; `error` is the exception if the batch failed."""
+    error = None
+
+
+class ScoreWriter(threading.Thread):
+    """Single writer: drains the queue and commits rows in batches."""
+
+    def __init__(self, path, batch_rows=SCORE_BATCH_ROWS, batch_ms=SCORE_BATCH_MS):
+        super().__init__(name="score-writer", daemon=True)
+        self.path = path
+        self.batch_rows = batch_rows
+        self.batch_delay = batch_ms / 1000
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.rows = 0 # committed so far
+        self.failed = 0 # lost in batches that could not be committed
+        self._submitted = itertools.count(1) # next() is atomic, safe from request threads
+        self.submitted = 0
+
+    @property
+    def pending(self):
+        return self.submitted - self.rows - self.failed
+
+    def submit(self, row):
+        """Queue a row. Returns an Event set once the row is committed (or failed, see `error`)."""
+        done = _Done()
+        self.submitted = next(self._submitted)
+        self.queue.put((row, done))
+        return done
+
+    def flush(self):
+        """Block until everything queued so far is committed."""
+        done = _Done()
+        self.queue.put((None, done))
+        done.wait()
+
+    def stop(self):
+        self.flush()
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        conn = _connect(self.path)
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.batch_delay
+            # Keep collecting until the batch is full, the delay is spent or a flush comes in
+            while len(batch) < self.batch_rows and batch[-1][0] is not None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    nxt = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    self.queue.put(None)
+                    break
+                batch.append(nxt)
+            rows = [row for row, _ in batch if row is not None]
+            error = None
+            if rows:
+                try:
+                    conn.executemany(_INSERT, rows)
+                    conn.commit()
+                    self.batches += 1
+                    self.rows += len(rows)
+                except sqlite3.Error as exc:
+                    # Lose this batch, not the writer: later scores must still get through
+                    logger.exception("Score batch of %s rows failed", len(rows))
+                    conn.rollback()
+                    self.failed += len(rows)
+                    error = exc
+            for row, done in batch:
+                if row is not None:
+                    done.error = error
+                done.set()
+        conn.close()
+
+
+class ScoreStore:
+    def __init__(self, path=DB_PATH, durable=SCORE_DURABLE):
+        self.path = path
+        self.durable = durable
+        self.pool = ConnectionPool(path)
+        self.writer = None
+        self.lock = threading.Lock()
+        # Top LEADERBOARD_CACHE_SIZE rows, best first; None until first read
+        self.top = None
+        self.top_keys = None
+        self.top_failed = 0 # writer.failed when the cache was loaded
+        self.top_loaded = 0.0 # time.monotonic() of the load
+        self.top_lock = threading.Lock()
+
+    def init_db(self):
+        with self.pool.connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS leaderboard (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    player_name TEXT NOT NULL,
+                    score_blue INTEGER NOT NULL,
+                    score_orange INTEGER NOT NULL,
+                    winner INTEGER NOT NULL,
+                    date TEXT NOT NULL,
+                    best_score INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            # Anciennes bases : on ajoute la colonne et on la remplit une fois
+            columns = [r[1] for r in conn.execute("PRAGMA table_info(leaderboard)")]
+            if "best_score" not in columns:
+                conn.execute("ALTER TABLE leaderboard ADD COLUMN best_score INTEGER NOT NULL DEFAULT 0")
+                conn.execute("UPDATE leaderboard SET best_score = MAX(score_blue, score_orange)")
+            # Covering index: the leaderboard query is answered from the index alone, no sort
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_leaderboard_best
+                ON leaderboard (best_score DESC, date DESC, player_name, score_blue, score_orange, winner)
+            """)
+            conn.commit()
+
+    def _get_writer(self):
+        with self.lock:
+            if self.writer is None:
+                self.writer = ScoreWriter(self.path)
+                self.writer.start()
+            return self.writer
+
+    def add_score(self, player_name, score_blue, score_orange, winner):
+        date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        row = (player_name, score_blue, score_orange, winner, date, max(score_blue, score_orange))
+        writer = self._get_writer()
+        with self.top_lock:
+            done = writer.submit(row)
+            if self.top is not None:
+                self._insert_top(dict(zip(_COLUMNS, row)))
+        if self.durable:
+            done.wait()
+            if done.error is not None:
+                raise done.error
+
+    def _insert_top(self, entry):
+        key = _sort_key(entry)
+        if len(self.top) >= LEADERBOARD_CACHE_SIZE and key >= self.top_keys[-1]:
+            return
+        # Equal keys go after the existing ones, like rows inserted later
+        i = bisect.bisect_right(self.top_keys, key)
+        self.top.insert(i, entry)
+        self.top_keys.insert(i, key)
+        del self.top[LEADERBOARD_CACHE_SIZE:]
+        del self.top_keys[LEADERBOARD_CACHE_SIZE:]
+
+    def flush(self):
+        if self.writer is not None:
+            self.writer.flush()
+
+    def get_leaderboard(self, limit=10):
+        if limit > LEADERBOARD_CACHE_SIZE:
+            return self._query_leaderboard(limit)
+        with self.top_lock:
+            if self.writer is not None and self.writer.failed != self.top_failed:
+                # Rows were cached but never committed: reload from the table
+                self.top = None
+            if self.top is not None and time.monotonic() - self.top_loaded >= LEADERBOARD_CACHE_TTL:
+                # Only this process's scores go into the cache, other workers' come with a reload
+                self.top = None
+            if self.top is None:
+                # add_score waits on top_lock, so no row can slip in between the query and the cache
+                self.top = self._query_leaderboard(LEADERBOARD_CACHE_SIZE)
+                self.top_keys = [_sort_key(e) for e in self.top]
+                self.top_failed = self.writer.failed if self.writer is not None else 0
+                self.top_loaded = time.monotonic()
+            return [dict(e) for e in self.top[:limit]]
+
+    def _query_leaderboard(self, limit):
+        # Read your own writes: scores still buffered are committed first
+        if self.writer is not None and self.writer.pending > 0:
+            self.writer.flush()
+        with self.pool.connection() as conn:
+            # On trie par la différence de score la plus grande (victoire écrasante)
+            # ou simplement par date pour voir les derniers exploits
+            rows = conn.execute("""
+                SELECT player_name, score_blue, score_orange, winner, date
+                FROM leaderboard
+                ORDER BY best_score DESC, date DESC
+                LIMIT ?
+            """, (limit,)).fetchall()
+        return [
+            {
+                "player_name": r[0],
+                "score_blue": r[1],
+                "score_orange": r[2],
+                "winner": r[3],
+                "date": r[4]
+            } for r in rows
+        ]
+
+    def close(self):
+        with self.lock:
+            if self.writer is not None:
+                self.writer.stop()
+                self.writer = None
+        self.pool.close()
+
+
+store = ScoreStore()
 
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS leaderboard (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            player_name TEXT NOT NULL,
-            score_blue INTEGER NOT NULL,
-            score_orange INTEGER NOT NULL,
-            winner INTEGER NOT NULL,
-            date TEXT NOT NULL
-        )
-    """)
-    conn.commit()
-    conn.close()
+    store.init_db()
 
 def add_score(player_name, score_blue, score_orange, winner):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO leaderboard (player_name, score_blue, score_orange, winner, date)
-        VALUES (?, ?, ?, ?, ?)
-    """, (player_name, score_blue, score_orange, winner, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-    conn.commit()
-    conn.close()
+    store.add_score(player_name, score_blue, score_orange, winner)
 
 def get_leaderboard(limit=10):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    # On trie par la différence de score la plus grande (victoire écrasante)
-    # ou simplement par date pour voir les derniers exploits
-    cursor.execute("""
-        SELECT player_name, score_blue, score_orange, winner, date 
-        FROM leaderboard 
-        ORDER BY MAX(score_blue, score_orange) DESC, date DESC 
-        LIMIT ?
-    """, (limit,))
-    rows = cursor.fetchall()
-    conn.close()
-    return [
-        {
-            "player_name": r[0],
-            "score_blue": r[1],
-            "score_orange": r[2],
-            "winner": r[3],
-            "date": r[4]
-        } for r in rows
-    ]
+    return store.get_leaderboard(limit)
+
+def close_db():
+    """Commit buffered scores and close connections (app shutdown)."""
+    store.close()
 
 if __name__ == "__main__":
     init_db()
@@ -1,16 +1,103 @@
+import os
 import random
+import struct
 import time
+from collections import deque
 
-EMPTY = 0
-WHITE = 1
-BLACK = 2
+import batch
+from bitboard import Bitboard, EMPTY, WHITE, BLACK, CELLS, NEIGHBOUR_LIST, square, coords, iter_bits
+from book import open_book
+from mcts import MCTS
+from search import Searcher
 
 PHASE_PLACEMENT = "PLACEMENT"
 PHASE_MOVEMENT = "MOVEMENT"
 
+EVENT_LOG_SIZE = 128 # events kept for delta responses (since_event_id)
+
+# Expert AI search limits: iterative deepening stops at whichever comes first
+EXPERT_MAX_DEPTH = int(os.environ.get("AI_MAX_DEPTH", 5)) # plies, root move included
+EXPERT_TIME_BUDGET = float(os.environ.get("AI_TIME_BUDGET", 2.0)) # seconds per move, 0 = no limit
+EXPERT_NODE_BUDGET = int(os.environ.get("AI_NODE_BUDGET", 0)) # nodes per move, 0 = no limit
+
+# MCTS level limits: anytime search, stops at whichever comes first
+# The search runs in a thread of the server and holds the GIL meanwhile (see ai_pool.THREAD_LEVELS):
+# kept short, it plays as well against "initie" at 0.5 s as at 2 s
+MCTS_TIME_BUDGET = float(os.environ.get("AI_MCTS_TIME_BUDGET", 0.5)) # seconds per move, 0 = no limit
+MCTS_ITERATIONS = int(os.environ.get("AI_MCTS_ITERATIONS", 0)) # playouts per move, 0 = no limit
+
+# Opening / endgame book probed by the expert before searching (None without book file)
+BOOK = open_book()
+
+# AI levels, in the order of their code in the binary format (unknown names play as "initie")
+AI_LEVELS = ("novice", "initie", "expert", "mcts")
+
+# Binary snapshot layout (Game.to_bytes), little endian:
+#   header   format, current, phase, ai level, flags, placed W/B, recent count,
+#            event count, move_count, event_id, score W/B, start_time
+#   board    81 cells x 2 bits (0 empty, 1 white, 2 black) = 21 bytes
+#   last event, then the recent positions (two 11-byte bitboards each),
+#   then the event log (fixed 8 bytes per event, ids are consecutive up to event_id)
+SNAPSHOT_FORMAT = 1
+_HEADER = struct.Struct("<BBBBBBBBHIIIId")
+EVENT_BYTES = 8
+_EVENT = struct.Struct("<BBBBBBBx") # type, player, fx/x, fy/y, tx, ty, captured (neighbour bits of tx,ty)
+_BOARD_BYTES = (CELLS * 2 + 7) // 8
+_MASK_BYTES = (CELLS + 7) // 8
+_EVENT_TYPES = (None, "place", "move", "fast_setup", "reset")
+_PHASES = (PHASE_PLACEMENT, PHASE_MOVEMENT)
+
+
+def pack_event(event):
+    if event is None:
+        return _EVENT.pack(0, 0, 0, 0, 0, 0, 0)
+    kind = event["type"]
+    if kind == "place":
+        return _EVENT.pack(1, event["player"], event["x"], event["y"], 0, 0, 0)
+    if kind == "move":
+        # Captured pieces are neighbours of the destination: one bit per neighbour
+        taken = {tuple(c) for c in event["captured"]}
+        captured = 0
+        for i, sq in enumerate(NEIGHBOUR_LIST[square(event["tx"], event["ty"])]):
+            if coords(sq) in taken:
+                captured |= 1 << i
+        return _EVENT.pack(2, event["player"], event["fx"], event["fy"], event["tx"], event["ty"], captured)
+    return _EVENT.pack(_EVENT_TYPES.index(kind), 0, 0, 0, 0, 0, 0)
+
+
+def unpack_event(data, offset, event_id):
+    kind, player, a, b, tx, ty, captured = _EVENT.unpack_from(data, offset)
+    if kind == 0:
+        return None
+    if kind == 1:
+        return {"type": "place", "player": player, "x": a, "y": b, "id": event_id}
+    if kind == 2:
+        around = NEIGHBOUR_LIST[square(tx, ty)]
+        return {
+            "type": "move",
+            "player": player,
+            "fx": a, "fy": b, "tx": tx, "ty": ty,
+            "captured": [coords(sq) for i, sq in enumerate(around) if captured >> i & 1],
+            "id": event_id
+        }
+    return {"type": _EVENT_TYPES[kind], "id": event_id}
+
+def rank_moves(bb, player, moves):
+    """(pieces captured, evaluation for `player` after the move) of every move, batched when numpy is there."""
+    if batch.AVAILABLE:
+        _, captured, scores = batch.score_moves(bb, player, moves)
+        return list(zip(captured.tolist(), scores.tolist()))
+    ranked = []
+    for f, t in moves:
+        caps = bb.make_move(player, f, t)
+        ranked.append((caps.bit_count(), bb.evaluate(player)))
+        bb.unmake_move(player, f, t, caps)
+    return ranked
+
+
 class Game:
     def __init__(self):
-        self.board = [[EMPTY for _ in range(9)] for _ in range(9)]
+        self.bb = Bitboard()
         self.current = WHITE
         self.players = {WHITE: "White", BLACK: "Black"}
         self.score = {WHITE: 0, BLACK: 0}
@@ -21,12 +108,26 @@ class Game:
         self.MAX_PIECES = 18
         self.last_event = None
         self.event_id = 0
-        self.last_board_snapshot = None # For loop prevention
+        self.events = deque(maxlen=EVENT_LOG_SIZE) # Event log, oldest first
+        self.recent_positions = deque(maxlen=4) # For loop prevention
         self.start_time = time.time()
         self.move_count = 0
+        self.last_search = None # Stats of the last expert search (nodes, depth, time)
+        self.on_event = None # Called with the game after every play/move/reset (push updates)
+        self._legal_cache = None # ((event_id, board hash), legal_moves()) for the side to move
+        self.mcts = None # MCTS tree of the "mcts" level, kept between turns (not serialized)
+
+    @property
+    def board(self):
+        """9x9 list-of-lists view of the bitboard (fresh copy)."""
+        return self.bb.to_rows()
+
+    @board.setter
+    def board(self, rows):
+        self.bb = Bitboard.from_rows(rows)
 
     def can_place(self, x, y):
-        return self.board[x][y] == EMPTY
+        return 0 <= x < 9 and 0 <= y < 9 and self.bb.get(square(x, y)) == EMPTY
 
     def play(self, x, y):
         """Handle placement phase moves."""
@@ -37,15 +138,21 @@ class Game:
              return {"error": "Invalid move: Cell not empty"}
 
         player = self.current
-        self.move_count += 1
         
         if self.pieces_placed[player] >= self.MAX_PIECES:
              return {"error": "All pieces placed"}
 
-        self.board[x][y] = player
+        self._apply_place(x, y)
+        self._notify()
+        return self.get_state()
+
+    def _apply_place(self, x, y):
+        player = self.current
+        self.move_count += 1
+        self.bb.place(player, square(x, y))
         self.pieces_placed[player] += 1
         self.event_id += 1
-        self.last_event = {"type": "place", "player": player, "x": x, "y": y, "id": self.event_id}
+        self._record({"type": "place", "player": player, "x": x, "y": y, "id": self.event_id})
 
         # Check for phase switch
         if self.pieces_placed[WHITE] >= self.MAX_PIECES and self.pieces_placed[BLACK] >= self.MAX_PIECES:
@@ -65,8 +172,7 @@ class Game:
                  # Current player continues if opponent is done
                  pass
 
-        self.last_board_snapshot = [row[:] for row in self.board]
-        return self.get_state()
+        self.recent_positions.append(self.bb.snapshot())
 
     def setup_fast_mode(self):
         """Pre-place all pieces randomly and skip to MOVEMENT phase."""
@@ -77,17 +183,19 @@ class Game:
         # Place 6 White and 6 Black pieces
         for _ in range(self.MAX_PIECES):
             wx, wy = empties.pop()
-            self.board[wx][wy] = WHITE
+            self.bb.place(WHITE, square(wx, wy))
             self.pieces_placed[WHITE] += 1
             
             bx, by = empties.pop()
-            self.board[bx][by] = BLACK
+            self.bb.place(BLACK, square(bx, by))
             self.pieces_placed[BLACK] += 1
             
         self.phase = PHASE_MOVEMENT
         self.current = WHITE
         self.event_id += 1
         self.last_event = {"type": "fast_setup", "id": self.event_id}
+        # Pieces were placed outside the log, clients need a full snapshot
+        self.events.clear()
 
     def check_capture(self, x, y, player):
         """
@@ -95,38 +203,16 @@ class Game:
         has at least 3 neighbouring `player` pieces (in 8-neighbourhood) is captured.
         Returns list of captured opponent positions.
         """
-        opponent = WHITE if player == BLACK else BLACK
-        captured = []
-
-        # offsets for 8 neighbours
-        neigh = [(-1,-1),(-1,0),(-1,1),(0,-1),(0,1),(1,-1),(1,0),(1,1)]
-
-        # examine opponent pieces in the neighbourhood of the moved-to cell
-        for dx, dy in neigh:
-            i = x + dx
-            j = y + dy
-            if 0 <= i < 9 and 0 <= j < 9 and self.board[i][j] == opponent:
-                # count how many neighbours around (i,j) are player's pieces
-                count = 0
-                for ddx, ddy in neigh:
-                    ni = i + ddx
-                    nj = j + ddy
-                    if 0 <= ni < 9 and 0 <= nj < 9:
-                        if self.board[ni][nj] == player:
-                            count += 1
-                # if count >= 3, capture this opponent piece
-                if count >= 3:
-                    captured.append((i, j))
-
-        return captured
+        captured = self.bb.captures(square(x, y), player)
+        return [coords(sq) for sq in iter_bits(captured)]
 
     def check_winner(self):
         if self.phase == PHASE_PLACEMENT:
             return None
             
         # Count pieces
-        w = sum(row.count(WHITE) for row in self.board)
-        b = sum(row.count(BLACK) for row in self.board)
+        w = self.bb.count(WHITE)
+        b = self.bb.count(BLACK)
         
         # If less than 3 pieces, cannot capture anymore
         if w < 3 and b >= 3:
@@ -165,68 +251,77 @@ class Game:
         if not (0 <= fx < 9 and 0 <= fy < 9 and 0 <= tx < 9 and 0 <= ty < 9):
              return {"error": "Out of bounds"}
         
-        if self.board[fx][fy] != player:
+        f, t = square(fx, fy), square(tx, ty)
+        if self.bb.get(f) != player:
             return {"error": "Not your piece"}
         
-        if self.board[tx][ty] != EMPTY:
+        if self.bb.get(t) != EMPTY:
             return {"error": "Destination not empty"}
 
         # Validate path (BFS depth 2 - allows any cell reachable in 1-2 steps through empty cells)
-        valid_destinations = set()
-        neigh = [(-1,-1),(-1,0),(-1,1),(0,-1),(0,1),(1,-1),(1,0),(1,1)]
-        
-        # 1-step moves
-        for dx1, dy1 in neigh:
-            nx1, ny1 = fx + dx1, fy + dy1
-            if 0 <= nx1 < 9 and 0 <= ny1 < 9 and self.board[nx1][ny1] == EMPTY:
-                valid_destinations.add((nx1, ny1))
-                # 2-step moves from the first empty cell
-                for dx2, dy2 in neigh:
-                    nx2, ny2 = nx1 + dx2, ny1 + dy2
-                    if 0 <= nx2 < 9 and 0 <= ny2 < 9 and self.board[nx2][ny2] == EMPTY:
-                        valid_destinations.add((nx2, ny2))
-        
-        if (tx, ty) not in valid_destinations:
+        if not self.bb.destinations(f) >> t & 1:
              return {"error": "Invalid path: destination not reachable in 1-2 steps through empty cells"}
 
-        # Execute move
-        self.board[fx][fy] = EMPTY
-        self.board[tx][ty] = player
-        self.move_count += 1
-        
-        # Check captures
-        captured = self.check_capture(tx, ty, player)
-        for (cx, cy) in captured:
-            self.board[cx][cy] = EMPTY
-
+        captured = self._apply_move(fx, fy, tx, ty)
         winner = self.check_winner()
+        self._notify()
+
+        return {
+            "board": self.board,
+            "captured": captured,
+            "winner": winner,
+            "nextPlayer": self.current,
+            "score": self.score
+        }
+
+    def _apply_move(self, fx, fy, tx, ty):
+        player = self.current
+        # Execute move (captures included)
+        captured_mask = self.bb.make_move(player, square(fx, fy), square(tx, ty))
+        if self.mcts is not None:
+            self.mcts.advance((square(fx, fy), square(tx, ty)))
+        captured = [coords(sq) for sq in iter_bits(captured_mask)]
+        self.move_count += 1
 
         # Switch player
         self.current = BLACK if player == WHITE else WHITE
         
         self.event_id += 1
-        self.last_event = {
+        self._record({
             "type": "move", 
             "player": player, 
             "fx": fx, "fy": fy, "tx": tx, "ty": ty, 
             "captured": captured,
             "id": self.event_id
-        }
+        })
         
-        # Save current board for loop prevention
-        self.last_board_snapshot = [row[:] for row in self.board]
+        # Remember this position for loop prevention
+        self.recent_positions.append(self.bb.snapshot())
+        return captured
 
-        return {
-            "board": [row[:] for row in self.board],
-            "captured": captured,
-            "winner": winner,
-            "nextPlayer": self.current,
-            "score": self.score
-        }
+    def replay(self, moves):
+        """
+        Fast path to rebuild a game: apply moves that were already validated
+        once (move log events, or (x, y) / (fx, fy, tx, ty) tuples) without
+        checking them again and without calling the listener. Returns self.
+        """
+        for m in moves:
+            if isinstance(m, dict):
+                if m["type"] == "place":
+                    self._apply_place(m["x"], m["y"])
+                elif m["type"] == "move":
+                    self._apply_move(m["fx"], m["fy"], m["tx"], m["ty"])
+                else:
+                    raise ValueError(f"Cannot replay a {m['type']} event")
+            elif len(m) == 2:
+                self._apply_place(*m)
+            else:
+                self._apply_move(*m)
+        return self
 
     def get_state(self):
         return {
-            "board": [row[:] for row in self.board],
+            "board": self.board,
             "current": self.current,
             "phase": self.phase,
             "pieces_placed": self.pieces_placed,
@@ -240,202 +335,233 @@ class Game:
             "start_time": self.start_time
         }
 
+    def to_bytes(self, events=True):
+        """
+        Fixed-layout binary snapshot (see SNAPSHOT_FORMAT), used by the game
+        stores, the AI workers and the replay log. `events=False` leaves the
+        event log out (AI workers don't need it). Listeners and AI stats are
+        not kept.
+        """
+        white, black = self.bb.pieces[WHITE], self.bb.pieces[BLACK]
+        board = 0
+        for sq in iter_bits(white):
+            board |= WHITE << (2 * sq)
+        for sq in iter_bits(black):
+            board |= BLACK << (2 * sq)
+        log = list(self.events) if events else []
+        level = AI_LEVELS.index(self.ai_difficulty) if self.ai_difficulty in AI_LEVELS else 1
+        parts = [
+            _HEADER.pack(
+                SNAPSHOT_FORMAT, self.current, _PHASES.index(self.phase), level, int(self.is_fast),
+                self.pieces_placed[WHITE], self.pieces_placed[BLACK], len(self.recent_positions),
+                len(log), self.move_count, self.event_id,
+                self.score.get(WHITE, 0), self.score.get(BLACK, 0), self.start_time),
+            board.to_bytes(_BOARD_BYTES, "little"),
+            pack_event(self.last_event),
+        ]
+        for w, b in self.recent_positions:
+            parts.append(w.to_bytes(_MASK_BYTES, "little") + b.to_bytes(_MASK_BYTES, "little"))
+        parts.extend(pack_event(e) for e in log)
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        (fmt, current, phase, level, flags, placed_w, placed_b, n_recent, n_events,
+         move_count, event_id, score_w, score_b, start_time) = _HEADER.unpack_from(data)
+        if fmt != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unknown snapshot format {fmt}")
+        game = cls()
+        offset = _HEADER.size
+        board = int.from_bytes(data[offset:offset + _BOARD_BYTES], "little")
+        offset += _BOARD_BYTES
+        white = black = 0
+        for sq in range(CELLS):
+            cell = board >> (2 * sq) & 3
+            if cell == WHITE: white |= 1 << sq
+            elif cell == BLACK: black |= 1 << sq
+        game.bb = Bitboard(white, black)
+        game.current = current
+        game.phase = _PHASES[phase]
+        game.ai_difficulty = AI_LEVELS[level]
+        game.is_fast = bool(flags & 1)
+        game.pieces_placed = {WHITE: placed_w, BLACK: placed_b}
+        game.move_count = move_count
+        game.event_id = event_id
+        game.score = {WHITE: score_w, BLACK: score_b}
+        game.start_time = start_time
+        game.last_event = unpack_event(data, offset, event_id)
+        offset += _EVENT.size
+        for _ in range(n_recent):
+            w = int.from_bytes(data[offset:offset + _MASK_BYTES], "little")
+            b = int.from_bytes(data[offset + _MASK_BYTES:offset + 2 * _MASK_BYTES], "little")
+            game.recent_positions.append((w, b))
+            offset += 2 * _MASK_BYTES
+        first_id = event_id - n_events + 1
+        for i in range(n_events):
+            game.events.append(unpack_event(data, offset, first_id + i))
+            offset += _EVENT.size
+        return game
+
+    def _record(self, event):
+        self.last_event = event
+        self.events.append(event)
+
+    def get_delta(self, since_event_id):
+        """
+        Events after `since_event_id` plus the small per-turn fields, or the
+        full state (with "delta": False) when the log no longer reaches back
+        that far (truncated, reset, fast setup).
+        """
+        first_id = self.events[0]["id"] if self.events else self.event_id + 1
+        if not (first_id - 1 <= since_event_id <= self.event_id):
+            state = self.get_state()
+            state["delta"] = False
+            return state
+        skip = since_event_id - first_id + 1
+        return {
+            "delta": True,
+            "since_event_id": since_event_id,
+            "events": list(self.events)[skip:],
+            "current": self.current,
+            "phase": self.phase,
+            "pieces_placed": self.pieces_placed,
+            "score": self.score,
+            "winner": self.check_winner(),
+            "last_event": self.last_event,
+            "event_id": self.event_id,
+            "move_count": self.move_count
+        }
+
     def _get_all_moves(self, player):
-        """Helper to get all valid moves for minimax. Returns list of ((fx,fy), (tx,ty))."""
-        my_pieces = [(i, j) for i in range(9) for j in range(9) if self.board[i][j] == player]
-        all_moves = []
-        neigh = [(-1,-1),(-1,0),(-1,1),(0,-1),(0,1),(1,-1),(1,0),(1,1)]
-        for r, c in my_pieces:
-            # First neighbors
-            for dx, dy in neigh:
-                nx1, ny1 = r + dx, c + dy
-                if 0 <= nx1 < 9 and 0 <= ny1 < 9 and self.board[nx1][ny1] == EMPTY:
-                    all_moves.append(((r, c), (nx1, ny1)))
-                    # Second neighbors from the first empty cell
-                    for dx2, dy2 in neigh:
-                        nx2, ny2 = nx1 + dx2, ny1 + dy2
-                        if 0 <= nx2 < 9 and 0 <= ny2 < 9 and self.board[nx2][ny2] == EMPTY:
-                            if (nx2, ny2) != (r, c):
-                                all_moves.append(((r, c), (nx2, ny2)))
-        # Unique moves
-        seen = set()
-        unique = []
-        for m in all_moves:
-            if m not in seen:
-                unique.append({"from": m[0], "to": m[1]})
-                seen.add(m)
-        return unique
+        """Helper to get all valid moves. Returns list of {"from": (fx,fy), "to": (tx,ty)}."""
+        return [{"from": coords(f), "to": coords(t)} for f, t in self.bb.moves(player)]
+
+    def legal_moves(self):
+        """{(x, y): [(tx, ty), ...]} for every piece of the side to move, cached until the next event."""
+        key = (self.event_id, self.bb.hash)
+        cache = self._legal_cache
+        if cache is None or cache[0] != key:
+            moves = {}
+            for f, t in self.bb.moves(self.current):
+                moves.setdefault(coords(f), []).append(coords(t))
+            cache = self._legal_cache = (key, moves)
+        return cache[1]
+
+    def valid_destinations(self, x, y):
+        """(tx, ty) cells the piece on (x, y) can move to, [] for an empty or off-board cell."""
+        if not (0 <= x < 9 and 0 <= y < 9):
+            return []
+        sq = square(x, y)
+        owner = self.bb.get(sq)
+        if owner == EMPTY:
+            return []
+        if owner == self.current:
+            # Clicks and hovers on the side to move are lookups in the cached set
+            return self.legal_moves().get((x, y), [])
+        return [coords(t) for t in iter_bits(self.bb.destinations(sq))]
 
     def evaluate(self, player):
-        opponent = WHITE if player == BLACK else BLACK
-        p_count = 0
-        o_count = 0
-        for row in self.board:
-            for cell in row:
-                if cell == player: p_count += 1
-                elif cell == opponent: o_count += 1
-        
-        if o_count < 3: return 100000
-        if p_count < 3: return -100000
-        
-        # Tactical evaluation
-        threat_score = 0
-        neigh = [(-1,-1),(-1,0),(-1,1),(0,-1),(0,1),(1,-1),(1,0),(1,1)]
-        
-        for r in range(9):
-            for c in range(9):
-                cell = self.board[r][c]
-                if cell == EMPTY: continue
-                
-                # Count enemies around
-                opp = WHITE if cell == BLACK else BLACK
-                enemies = 0
-                for dr, dc in neigh:
-                    nr, nc = r+dr, c+dc
-                    if 0 <= nr < 9 and 0 <= nc < 9 and self.board[nr][nc] == opp:
-                        enemies += 1
-                
-                # If a piece is surrounded by 2 enemies, it's in danger (need 3 to capture)
-                # If it's surrounded by 3+, it's toast or capturing
-                val = 0
-                if enemies == 2: val = -50
-                if enemies >= 3: val = -200
-                
-                if cell == player: threat_score += val
-                else: threat_score -= val # Enemy danger is good
-        
-        # Center bonus (subtle) to encourage occupation
-        center_bonus = 0
-        for r in range(9):
-            for c in range(9):
-                if self.board[r][c] == player:
-                    dist_to_center = abs(r-4) + abs(c-4)
-                    center_bonus += (8 - dist_to_center)
-
-        return (p_count - o_count) * 1000 + threat_score + center_bonus
+        return self.bb.evaluate(player)
 
-    def minimax(self, depth, is_maximizing, player, alpha, beta):
-        winner = self.check_winner()
-        if depth == 0 or winner:
-            opp_val = WHITE if player == BLACK else BLACK
-            return self.evaluate(player if is_maximizing else opp_val)
-
-        moves = self._get_all_moves(player if is_maximizing else (WHITE if player == BLACK else BLACK))
-        if not moves: return self.evaluate(player)
-
-        if is_maximizing:
-            max_eval = -float('inf')
-            for m in moves:
-                f, t = m["from"], m["to"]
-                # Save & Apply
-                caps = self.check_capture(t[0], t[1], player)
-                self.board[f[0]][f[1]] = EMPTY
-                self.board[t[0]][t[1]] = player
-                for cx, cy in caps: self.board[cx][cy] = EMPTY
-                
-                eval = self.minimax(depth - 1, False, player, alpha, beta)
-                
-                # Undo
-                opp = WHITE if player == BLACK else BLACK
-                for cx, cy in caps: self.board[cx][cy] = opp
-                self.board[t[0]][t[1]] = EMPTY
-                self.board[f[0]][f[1]] = player
-                
-                max_eval = max(max_eval, eval)
-                alpha = max(alpha, eval)
-                if beta <= alpha: break
-            return max_eval
-        else:
-            min_eval = float('inf')
-            opp = WHITE if player == BLACK else BLACK
-            for m in moves:
-                f, t = m["from"], m["to"]
-                # Save & Apply
-                caps = self.check_capture(t[0], t[1], opp)
-                self.board[f[0]][f[1]] = EMPTY
-                self.board[t[0]][t[1]] = opp
-                for cx, cy in caps: self.board[cx][cy] = EMPTY
-                
-                eval = self.minimax(depth - 1, True, player, alpha, beta)
-                
-                # Undo
-                for cx, cy in caps: self.board[cx][cy] = player
-                self.board[t[0]][t[1]] = EMPTY
-                self.board[f[0]][f[1]] = opp
-                
-                min_eval = min(min_eval, eval)
-                beta = min(beta, eval)
-                if beta <= alpha: break
-            return min_eval
+    def book_move(self, player):
+        """The book's answer for this position as an ai_move result, or None."""
+        if BOOK is None:
+            return None
+        if self.phase == PHASE_PLACEMENT:
+            sq = BOOK.probe(self.bb, player, placement=True)
+            return coords(sq) if sq is not None and self.bb.get(sq) == EMPTY else None
+        move = BOOK.probe(self.bb, player)
+        if move is None:
+            return None
+        f, t = move
+        # Guard against key collisions, and don't let the book walk into a repetition
+        if self.bb.get(f) != player or not self.bb.destinations(f) >> t & 1:
+            return None
+        bb = self.bb.copy()
+        bb.make_move(player, f, t)
+        if bb.snapshot() in self.recent_positions:
+            return None
+        self.last_search = {"nodes": 0, "depth": 0, "time": 0, "nps": 0, "book": True}
+        return {"from": coords(f), "to": coords(t)}
 
     def ai_move(self, player):
+        if self.ai_difficulty == "expert":
+            book = self.book_move(player)
+            if book is not None:
+                return book
+
         if self.phase == PHASE_PLACEMENT:
-            empties = [(i, j) for i in range(9) for j in range(9) if self.board[i][j] == EMPTY]
+            empties = [coords(sq) for sq in iter_bits(self.bb.empty())]
             return random.choice(empties) if empties else None
         
         if self.ai_difficulty == "novice":
-            moves = self._get_all_moves(player)
-            return random.choice(moves) if moves else None
+            moves = self.bb.moves(player)
+            if not moves: return None
+            f, t = random.choice(moves)
+            return {"from": coords(f), "to": coords(t)}
+
+        # Search on a private copy so concurrent readers never see a half-made move
+        bb = self.bb.copy()
 
         if self.ai_difficulty == "expert":
-            best_val = -float('inf')
-            best_move = None
-            moves = self._get_all_moves(player)
-            if not moves: return None
-            
-            # Use Alpha-Beta at top level too
-            alpha = -float('inf')
-            beta = float('inf')
-            
-            for m in moves:
-                f, t = m["from"], m["to"]
-                # Save & Apply
-                caps = self.check_capture(t[0], t[1], player)
-                self.board[f[0]][f[1]] = EMPTY
-                self.board[t[0]][t[1]] = player
-                for cx, cy in caps: self.board[cx][cy] = EMPTY
-                
-                val = self.minimax(4, False, player, alpha, beta)
-                
-                # Undo
-                opp = WHITE if player == BLACK else BLACK
-                for cx, cy in caps: self.board[cx][cy] = opp
-                self.board[t[0]][t[1]] = EMPTY
-                self.board[f[0]][f[1]] = player
-                
-                # Small penalty for repeating the immediate previous state
-                if self.last_board_snapshot:
-                    if self.board == self.last_board_snapshot:
-                        val -= 500 # Strong deterrent
-
-                if val > best_val:
-                    best_val = val
-                    best_move = m
-                    alpha = max(alpha, val)
-            return best_move
+            searcher = Searcher(player)
+            best_move, _, _ = searcher.iterative_deepening(
+                bb, EXPERT_MAX_DEPTH,
+                time_budget=EXPERT_TIME_BUDGET, node_budget=EXPERT_NODE_BUDGET,
+                avoid=self.recent_positions)
+            self.last_search = searcher.report()
+            if best_move is None: return None
+            return {"from": coords(best_move[0]), "to": coords(best_move[1])}
+
+        if self.ai_difficulty == "mcts":
+            # Runs in a thread on the live game: a reset meanwhile replaces self.mcts
+            tree = self.mcts
+            if tree is None:
+                tree = self.mcts = MCTS()
+            best_move = tree.search(bb, player, time_budget=MCTS_TIME_BUDGET,
+                                    iterations=MCTS_ITERATIONS, avoid=self.recent_positions)
+            self.last_search = tree.report()
+            if best_move is None: return None
+            return {"from": coords(best_move[0]), "to": coords(best_move[1])}
 
         # Default: Initié (Greedy capture)
-        valid_moves = self._get_all_moves(player)
-        if not valid_moves: return None
+        return self.greedy_move(player)
+
+    def greedy_move(self, player):
+        """The "initie" level's move in the movement phase, whatever the game's level (search fallback)."""
+        bb = self.bb.copy()
+        moves = bb.moves(player)
+        if not moves: return None
         best_move = None
         max_capture = -1
-        for mv in valid_moves:
-            f, t = mv["from"], mv["to"]
-            caps = len(self.check_capture(t[0], t[1], player))
+        # Counts only: the bitboard is faster than a NumPy batch here (no evaluation needed)
+        for m in moves:
+            caps = bb.move_captures(player, *m).bit_count()
             if caps > max_capture:
                 max_capture = caps
-                best_move = mv
+                best_move = m
             elif caps == max_capture and random.random() < 0.3:
-                best_move = mv
-        return best_move or random.choice(valid_moves)
+                best_move = m
+        f, t = best_move
+        return {"from": coords(f), "to": coords(t)}
+
+    def _notify(self):
+        if self.on_event is not None:
+            self.on_event(self)
 
     def reset(self):
         saved_fast = self.is_fast
         saved_diff = self.ai_difficulty
+        saved_listener = self.on_event
+        saved_event_id = self.event_id
         self.__init__()
         self.is_fast = saved_fast
         self.ai_difficulty = saved_diff
-        self.last_board_snapshot = None
+        self.on_event = saved_listener
+        # Keep event ids increasing so clients can tell the reset happened
+        self.event_id = saved_event_id + 1
+        self.last_event = {"type": "reset", "id": self.event_id}
         if saved_fast:
             self.setup_fast_mode()
+        self._notify()
 
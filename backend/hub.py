@@ -0,0 +1,78 @@
+"""
+WebSocket fan-out.
+
+Clients subscribe to a channel ("lobby" or "game:<game_id>") and receive every
+message published on it. Publishing is thread-safe: sync endpoints run in the
+threadpool and hand their messages over to the event loop. Each connection
+has its own bounded queue so one slow client never holds up the others; when
+it is full the oldest message is dropped (every message carries the full
+state, so the newest one is enough to catch up).
+"""
+import asyncio
+import json
+
+from fastapi import WebSocketDisconnect
+
+QUEUE_SIZE = 32
+
+
+class ConnectionHub:
+    def __init__(self):
+        self.channels = {} # channel -> {websocket: asyncio.Queue}
+        self.loop = None
+
+    def has_subscribers(self, channel):
+        return bool(self.channels.get(channel))
+
+    def subscriber_count(self):
+        return sum(len(subs) for subs in self.channels.values())
+
+    async def serve(self, channel, websocket, initial=None):
+        """Accept the socket and keep it subscribed to `channel` until it closes."""
+        await websocket.accept()
+        self.loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        if initial is not None:
+            queue.put_nowait(json.dumps(initial))
+        self.channels.setdefault(channel, {})[websocket] = queue
+        sender = asyncio.create_task(self._sender(websocket, queue))
+        try:
+            while True:
+                # Clients only send keep-alives, nothing to handle
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            sender.cancel()
+            self._remove(channel, websocket)
+
+    def publish(self, channel, message):
+        """Queue `message` (a JSON-able dict) for every subscriber. Callable from any thread."""
+        if self.loop is None or not self.has_subscribers(channel):
+            return
+        text = json.dumps(message)
+        self.loop.call_soon_threadsafe(self._enqueue, channel, text)
+
+    def _enqueue(self, channel, text):
+        for queue in list(self.channels.get(channel, {}).values()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(text)
+
+    async def _sender(self, websocket, queue):
+        try:
+            while True:
+                await websocket.send_text(await queue.get())
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+
+    def _remove(self, channel, websocket):
+        subs = self.channels.get(channel)
+        if subs is None:
+            return
+        subs.pop(websocket, None)
+        if not subs:
+            del self.channels[channel]
+
+
+hub = ConnectionHub()
@@ -1,13 +1,27 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, WebSocket
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from game import Game
+import asyncio
 import logging
-from database import init_db, add_score, get_leaderboard
+import os
+from database import init_db, add_score, get_leaderboard, close_db
 from manager import manager
+import game as game_module
+from ai_pool import pool as ai_pool
+from scheduler import scheduler as ai_scheduler
+from ponder import ponderer
+from hub import hub
+from store import MemoryStore, VersionConflict
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("mon_board")
 
+GAME_EXPIRY_INTERVAL = float(os.environ.get("GAME_EXPIRY_INTERVAL", 60)) # seconds between cleanups
+# Seconds between checks of a shared store for changes made by other workers, 0 = never
+STORE_POLL_INTERVAL = float(os.environ.get("STORE_POLL_INTERVAL", 0.5))
+
 app = FastAPI()
 init_db() # Ensure DB is ready
 
@@ -19,71 +33,204 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+pushed = {} # channel -> game version or lobby list last published
+
+def publish_game(game_id, entry):
+    channel = f"game:{game_id}"
+    pushed[channel] = entry["version"]
+    hub.publish(channel, {"type": "state", "game_id": game_id, "state": entry["game"].get_state()})
+
+def publish_lobby(games):
+    pushed["lobby"] = games
+    hub.publish("lobby", {"type": "lobby", "games": games})
+
+def push_update(kind, game_id):
+    """Manager listener: forward game and lobby changes to WebSocket subscribers."""
+    if kind == "game":
+        entry = manager.get_entry(game_id)
+        if entry and hub.has_subscribers(f"game:{game_id}"):
+            publish_game(game_id, entry)
+    elif kind == "lobby" and hub.has_subscribers("lobby"):
+        publish_lobby(manager.list_waiting_games())
+
+def poll_store():
+    """
+    Publish the changes other workers made: their listeners only reach their
+    own sockets, the store is all the workers share.
+    """
+    channels = list(hub.channels)
+    for channel in channels:
+        if channel == "lobby":
+            games = manager.list_waiting_games()
+            if games != pushed.get(channel):
+                publish_lobby(games)
+        elif channel.startswith("game:"):
+            game_id = channel[len("game:"):]
+            # Reloads the entry when the stored version moved on
+            entry = manager.get_entry(game_id)
+            if entry and entry["version"] != pushed.get(channel):
+                publish_game(game_id, entry)
+    for channel in set(pushed) - set(channels):
+        pushed.pop(channel, None)
+
+async def watch_store(interval):
+    """Background task: run poll_store every `interval` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(poll_store)
+        except Exception:
+            logger.exception("Polling the game store failed")
+
+manager.add_listener(push_update)
+manager.add_listener(ponderer.listener)
+
+@app.exception_handler(VersionConflict)
+def version_conflict(request: Request, exc: VersionConflict):
+    # Another worker changed the game first; the client refetches /state and retries
+    return JSONResponse(status_code=409, content={"error": "Game changed concurrently, please retry"})
+
+def state_for(game, since_event_id):
+    """Full state, or only the events after `since_event_id` when the client has one."""
+    if since_event_id < 0:
+        return game.get_state()
+    return game.get_delta(since_event_id)
+
+def slim(result, since_event_id):
+    """Drop the board copy from an action result when the client asked for a delta."""
+    if since_event_id < 0 or not isinstance(result, dict):
+        return result
+    return {k: v for k, v in result.items() if k != "board"}
+
+@app.on_event("startup")
+async def start_expiry():
+    if manager.log.directory:
+        logger.info("Restored %s games from the move log", manager.recover())
+    # Idle games are dropped in the background instead of on /games/list hits
+    app.state.expiry_task = asyncio.create_task(manager.expire_forever(GAME_EXPIRY_INTERVAL))
+    # A process-local store has a single worker, its listeners already see every change
+    if STORE_POLL_INTERVAL > 0 and not isinstance(manager.store, MemoryStore):
+        app.state.store_task = asyncio.create_task(watch_store(STORE_POLL_INTERVAL))
+
+@app.on_event("shutdown")
+def shutdown_ai_pool():
+    for name in ("expiry_task", "store_task"):
+        task = getattr(app.state, name, None)
+        if task: task.cancel()
+    ai_pool.shutdown()
+    close_db()
+    manager.store.close()
+    manager.log.close()
+
 @app.get("/state")
-def get_state(game_id: str):
+def get_state(game_id: str, since_event_id: int = -1):
     game = manager.get_game(game_id)
     if not game: return {"error": "Game not found"}
-    return game.get_state()
+    with manager.lock(game_id):
+        return state_for(game, since_event_id)
 
 @app.post("/play")
-def play(game_id: str, x: int, y: int):
+def play(game_id: str, x: int, y: int, since_event_id: int = -1):
     game = manager.get_game(game_id)
     if not game: return {"error": "Game not found"}
-    result = game.play(x, y)
+    with manager.lock(game_id):
+        result = game.play(x, y)
+        state = state_for(game, since_event_id)
     logger.info("/play called [%s] x=%s y=%s result=%s", game_id, x, y, result)
-    state = game.get_state()
-    state["action_result"] = result
+    state["action_result"] = slim(result, since_event_id)
     return state
 
 @app.post("/move")
-def move_piece(game_id: str, fx: int, fy: int, tx: int, ty: int):
+def move_piece(game_id: str, fx: int, fy: int, tx: int, ty: int, since_event_id: int = -1):
     game = manager.get_game(game_id)
     if not game: return {"error": "Game not found"}
-    result = game.move_piece(fx, fy, tx, ty)
+    with manager.lock(game_id):
+        result = game.move_piece(fx, fy, tx, ty)
+        state = state_for(game, since_event_id)
     logger.info("/move called [%s] fx=%s fy=%s tx=%s ty=%s result=%s", game_id, fx, fy, tx, ty, result)
-    state = game.get_state()
-    state["action_result"] = result
+    state["action_result"] = slim(result, since_event_id)
     return state
 
-@app.post("/play_ai")
-def play_ai(game_id: str, x: int = -1, y: int = -1, fx: int = -1, fy: int = -1, tx: int = -1, ty: int = -1, ai_player: int = 2):
-    game = manager.get_game(game_id)
-    if not game: return {"error": "Game not found"}
-    
-    human_res = {}
-    h_type = "place" if game.phase == "PLACEMENT" else "move"
-    if game.phase == "PLACEMENT":
-        if x == -1 or y == -1:
-             return {"error": "Missing coordinates for placement"}
-        human_res = game.play(x, y)
-    elif game.phase == "MOVEMENT":
-        if fx == -1: # check if movement coords provided
-             return {"error": "Missing coordinates for movement"}
-        human_res = game.move_piece(fx, fy, tx, ty)
-    
-    human = {"type": h_type, "result": human_res, "error": human_res.get("error")}
-    
-    logger.info("/play_ai [%s] human action result=%s", game_id, human)
+def human_turn(game_id, game, x, y, fx, fy, tx, ty, ai_player):
+    """The human's half of /play_ai: {"type", "result", "ai_turn", "event_id"}, or an error response."""
+    # The game lock is held while the game changes, not while the AI thinks
+    with manager.lock(game_id):
+        h_type = "place" if game.phase == "PLACEMENT" else "move"
+        human_res = {}
+        if game.phase == "PLACEMENT":
+            if x == -1 or y == -1:
+                 return {"error": "Missing coordinates for placement"}
+            human_res = game.play(x, y)
+        elif game.phase == "MOVEMENT":
+            if fx == -1: # check if movement coords provided
+                 return {"error": "Missing coordinates for movement"}
+            human_res = game.move_piece(fx, fy, tx, ty)
+        return {
+            "type": h_type,
+            "result": human_res,
+            "ai_turn": game.current == ai_player and not human_res.get("error"),
+            "event_id": game.event_id,
+        }
 
+def ai_turn(game_id, mv, event_id, since_event_id):
+    """The AI's half of /play_ai: plays `mv` unless the game moved on. Returns (game, result, solo)."""
+    # The entry may have been reloaded from the store during the search
+    game = manager.get_game(game_id)
+    if not game: return None, None, False
     ai_result = None
-    # if it's AI's turn, compute and play
-    if game.current == ai_player and not human.get("error"):
-        mv = game.ai_move(ai_player)
+    with manager.lock(game_id):
+        if game.event_id != event_id:
+            # The game moved on (reset, concurrent move) while the AI was thinking
+            logger.info("/play_ai [%s] position changed during AI search, move dropped", game_id)
+            mv = None
         if mv:
             if game.phase == "PLACEMENT":
                 # mv is (x, y)
                 ax, ay = mv
                 ai_res = game.play(ax, ay)
-                ai_result = {"type": "place", "x": ax, "y": ay, "result": ai_res}
+                ai_result = {"type": "place", "x": ax, "y": ay, "result": slim(ai_res, since_event_id)}
             elif game.phase == "MOVEMENT":
                 # mv is {"from": (r,c), "to": (nx,ny)}
                 f, t = mv["from"], mv["to"]
                 ai_res = game.move_piece(f[0], f[1], t[0], t[1])
-                ai_result = {"type": "move", "from": f, "to": t, "result": ai_res}
-            
+                ai_result = {"type": "move", "from": f, "to": t, "result": slim(ai_res, since_event_id), "search": game.last_search}
+
             logger.info("/play_ai [%s] AI played result=%s", game_id, ai_result)
+    entry = manager.get_entry(game_id)
+    return game, ai_result, entry is not None and entry["type"] == "solo"
+
+def final_state(game_id, game, since_event_id):
+    with manager.lock(game_id):
+        return state_for(game, since_event_id)
+
+@app.post("/play_ai")
+async def play_ai(game_id: str, x: int = -1, y: int = -1, fx: int = -1, fy: int = -1, tx: int = -1, ty: int = -1, ai_player: int = 2, since_event_id: int = -1):
+    # Store reads and writes block: they run in the threadpool, the event loop only awaits
+    game = await run_in_threadpool(manager.get_game, game_id)
+    if not game: return {"error": "Game not found"}
+    # The human is moving: the replies pondered for other moves are of no use now
+    ponderer.stop(game_id)
 
-    state = game.get_state()
+    turn = await run_in_threadpool(human_turn, game_id, game, x, y, fx, fy, tx, ty, ai_player)
+    if "result" not in turn:
+        return turn
+    human_res = turn["result"]
+    human = {"type": turn["type"], "result": slim(human_res, since_event_id), "error": human_res.get("error")}
+    
+    logger.info("/play_ai [%s] human action result=%s", game_id, human)
+
+    ai_result = None
+    # if it's AI's turn, compute and play
+    if turn["ai_turn"]:
+        mv = ponderer.lookup(game_id, game, ai_player)
+        if mv is None:
+            mv = await ai_scheduler.ai_move(game, ai_player)
+        game, ai_result, solo = await run_in_threadpool(ai_turn, game_id, mv, turn["event_id"], since_event_id)
+        if not game: return {"error": "Game not found"}
+        if ai_result and ai_result["type"] == "move" and solo:
+            ponderer.start(game_id, game, ai_player)
+
+    state = await run_in_threadpool(final_state, game_id, game, since_event_id)
     state.update({
         "afterHuman": human,
         "afterAI": ai_result
@@ -93,8 +240,11 @@ def play_ai(game_id: str, x: int = -1, y: int = -1, fx: int = -1, fy: int = -1,
 @app.post("/reset")
 def reset(game_id: str):
     game = manager.get_game(game_id)
-    if game: game.reset()
-    return game.get_state() if game else {"status": "not_found"}
+    if not game: return {"status": "not_found"}
+    ponderer.stop(game_id)
+    with manager.lock(game_id):
+        game.reset()
+        return game.get_state()
 
 @app.post("/games/create")
 def create_game(type: str = "solo", is_fast: bool = False, ai_difficulty: str = "initie"):
@@ -110,14 +260,34 @@ def join_game(game_id: str):
 def valid_moves(game_id: str, x: int, y: int):
     game = manager.get_game(game_id)
     if not game: return {"error": "Game not found"}
-    # Filter moves for this specific piece
-    all_m = game._get_all_moves(game.board[x][y])
-    piece_moves = [m["to"] for m in all_m if m["from"] == (x, y)]
-    return {"moves": [{"x": m[0], "y": m[1]} for m in piece_moves]}
+    return {"moves": [{"x": tx, "y": ty} for tx, ty in game.valid_destinations(x, y)]}
+
+@app.get("/ai/stats")
+def ai_stats():
+    return {
+        # Searches run in the pool's workers, each with its own table
+        "transposition_table": ai_pool.table_stats(),
+        "book": game_module.BOOK.stats() if game_module.BOOK else None,
+        "pool": {"workers": ai_pool.workers, "timeout": ai_pool.timeout},
+        "scheduler": ai_scheduler.stats(),
+        "ponder": ponderer.stats(),
+    }
+
+@app.websocket("/ws/lobby")
+async def lobby_socket(websocket: WebSocket):
+    games = await run_in_threadpool(manager.list_waiting_games)
+    await hub.serve("lobby", websocket, {"type": "lobby", "games": games})
+
+@app.websocket("/ws/games/{game_id}")
+async def game_socket(websocket: WebSocket, game_id: str):
+    game = await run_in_threadpool(manager.get_game, game_id)
+    if not game:
+        await websocket.close(code=4404)
+        return
+    await hub.serve(f"game:{game_id}", websocket, {"type": "state", "game_id": game_id, "state": game.get_state()})
 
 @app.get("/games/list")
 def list_games():
-    manager.cleanup() # aprovechamos para limpiar
     return {"games": manager.list_waiting_games()}
 
 @app.post("/submit_score")
@@ -1,11 +1,129 @@
+import asyncio
+import contextlib
+import heapq
+import logging
+import os
+import threading
 import uuid
 import time
 from game import Game
+from store import open_store, VersionConflict
+from movelog import MoveLog
+
+logger = logging.getLogger("mon_board")
+
+SHARDS = 16
+# Where games are persisted, see store.py (memory, sqlite:///path, redis://host:port/db)
+GAME_STORE = os.environ.get("GAME_STORE", "memory")
 
 class GameManager:
-    def __init__(self):
-        self.games = {} # game_id -> { "game": GameInstance, "last_active": timestamp, "type": "solo"|"multi" }
+    """
+    Live games, split over shards so inserts and deletes only lock one shard.
+
+    Multiplayer games waiting for a second player are indexed by the store,
+    and expiry uses a min-heap of last activity times refreshed lazily: touching
+    a game only updates its entry, the heap is fixed up when the game reaches
+    the top. Each game has its own lock so concurrent requests on one game are
+    serialized while different games proceed in parallel.
+
+    Every change is written through to `store` under optimistic versioning
+    (the game's event_id): the in-memory entries are a cache, reloaded when
+    the stored version moved on because another worker played. A write that
+    lost the race raises store.VersionConflict and the entry is reloaded on
+    the next access.
+    """
+
+    def __init__(self, shards=SHARDS, store=None, log=None):
+        # game_id -> { "game": GameInstance, "last_active": timestamp, "type": "solo"|"multi", "players": n,
+        #              "lock": RLock, "version": stored event_id }
+        self.shards = [{} for _ in range(shards)]
+        self.shard_locks = [threading.Lock() for _ in range(shards)]
+        self.store = store if store is not None else open_store(GAME_STORE)
+        self.log = log if log is not None else MoveLog()
+        self.expiry = [] # min-heap of (last_active, game_id)
+        self.index_lock = threading.Lock() # guards expiry
         self.cleanup_threshold = 3600 # 1 heure d'inactivité
+        self.listeners = [] # callables(kind, game_id) with kind "game", "lobby" or "expired"
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def _notify(self, kind, game_id):
+        for listener in self.listeners:
+            listener(kind, game_id)
+
+    def _shard(self, game_id):
+        return hash(game_id) % len(self.shards)
+
+    def _cached(self, game_id):
+        return self.shards[self._shard(game_id)].get(game_id)
+
+    def get_entry(self, game_id):
+        """Cached entry, refreshed from the store if another worker changed the game."""
+        entry = self._cached(game_id)
+        version = self.store.version(game_id)
+        if version is None:
+            if entry is not None:
+                self._drop(game_id)
+            return None
+        if entry is not None and entry["version"] == version:
+            return entry
+        record = self.store.load(game_id)
+        if record is None:
+            return None
+        if entry is None:
+            entry = {"lock": threading.RLock(), "last_active": time.time()}
+            self._fill(game_id, entry, record)
+            idx = self._shard(game_id)
+            with self.shard_locks[idx]:
+                cached = self.shards[idx].setdefault(game_id, entry)
+            if cached is entry:
+                with self.index_lock:
+                    heapq.heappush(self.expiry, (entry["last_active"], game_id))
+                return entry
+            entry = cached
+        # Same lock object across reloads, so holders keep excluding each other
+        with entry["lock"]:
+            if entry["version"] != record["version"]:
+                self._fill(game_id, entry, record)
+        return entry
+
+    def _fill(self, game_id, entry, record):
+        game = Game.from_bytes(record["data"])
+        game.on_event = lambda g: self._save(game_id, g)
+        entry.update(game=game, type=record["type"], players=record["players"], version=record["version"])
+
+    def _record(self, entry, game):
+        return {
+            "data": game.to_bytes(),
+            "version": game.event_id,
+            "type": entry["type"],
+            "players": entry["players"],
+            "last_active": entry["last_active"],
+        }
+
+    def _save(self, game_id, game):
+        """Game listener: write the change through, then tell the listeners."""
+        entry = self._cached(game_id)
+        if entry is None or entry["game"] is not game:
+            # Played on a copy that was reloaded or expired meanwhile
+            raise VersionConflict(game_id)
+        entry["last_active"] = time.time()
+        try:
+            self.store.save(game_id, self._record(entry, game), entry["version"])
+        except VersionConflict:
+            # Someone else wrote first: forget our copy, the next access reloads theirs
+            entry["version"] = None
+            raise
+        entry["version"] = game.event_id
+        if game.last_event["type"] in ("place", "move"):
+            self.log.append(game_id, game)
+        else:
+            self.log.snapshot(game_id, game, entry["type"], entry["players"])
+        self._notify("game", game_id)
+
+    def count(self):
+        return sum(len(shard) for shard in self.shards)
 
     def create_game(self, game_type="solo", is_fast=False, ai_difficulty="initie"):
         game_id = str(uuid.uuid4())[:8]
@@ -13,39 +131,126 @@ class GameManager:
         game.ai_difficulty = ai_difficulty
         if is_fast:
             game.setup_fast_mode()
-        self.games[game_id] = {
+        game.on_event = lambda g: self._save(game_id, g)
+        now = time.time()
+        entry = {
             "game": game,
-            "last_active": time.time(),
+            "last_active": now,
             "type": game_type,
-            "players": 1 if game_type == "solo" else 0
+            "players": 1 if game_type == "solo" else 0,
+            "lock": threading.RLock(),
+            "version": game.event_id
         }
+        self.store.save(game_id, self._record(entry, game), None)
+        self.log.snapshot(game_id, game, game_type, entry["players"])
+        idx = self._shard(game_id)
+        with self.shard_locks[idx]:
+            self.shards[idx][game_id] = entry
+        with self.index_lock:
+            heapq.heappush(self.expiry, (now, game_id))
+        if game_type == "multi":
+            self._notify("lobby", game_id)
         return game_id
 
     def get_game(self, game_id):
-        if game_id in self.games:
-            self.games[game_id]["last_active"] = time.time()
-            return self.games[game_id]["game"]
-        return None
+        entry = self.get_entry(game_id)
+        if entry is None:
+            return None
+        entry["last_active"] = time.time()
+        return entry["game"]
+
+    def lock(self, game_id):
+        """Per-game lock (reentrant); a no-op context for unknown games."""
+        entry = self._cached(game_id) or self.get_entry(game_id)
+        return entry["lock"] if entry is not None else contextlib.nullcontext()
 
     def join_game(self, game_id):
-        if game_id in self.games and self.games[game_id]["type"] == "multi":
-            if self.games[game_id]["players"] < 2:
-                self.games[game_id]["players"] += 1
-                self.games[game_id]["last_active"] = time.time()
-                return True
-        return False
+        entry = self.get_entry(game_id)
+        if entry is None or entry["type"] != "multi":
+            return False
+        with entry["lock"]:
+            if entry["players"] >= 2:
+                return False
+            entry["players"] += 1
+            entry["last_active"] = time.time()
+            try:
+                self.store.save(game_id, self._record(entry, entry["game"]), entry["version"])
+            except VersionConflict:
+                entry["version"] = None
+                raise
+            self.log.snapshot(game_id, entry["game"], entry["type"], entry["players"])
+        self._notify("lobby", game_id)
+        return True
 
     def list_waiting_games(self):
         # Liste les parties multi qui attendent un 2ème joueur
-        return [gid for gid, data in self.games.items() 
-                if data["type"] == "multi" and data["players"] < 2]
+        return self.store.waiting()
 
-    def cleanup(self):
-        now = time.time()
-        to_delete = [gid for gid, data in self.games.items() 
-                     if now - data["last_active"] > self.cleanup_threshold]
-        for gid in to_delete:
-            del self.games[gid]
-        return len(to_delete)
+    def _drop(self, game_id):
+        idx = self._shard(game_id)
+        with self.shard_locks[idx]:
+            self.shards[idx].pop(game_id, None)
+
+    def cleanup(self, now=None):
+        """Drop games idle for more than cleanup_threshold. Returns how many were removed."""
+        now = time.time() if now is None else now
+        limit = now - self.cleanup_threshold
+        removed = 0
+        with self.index_lock:
+            while self.expiry and self.expiry[0][0] < limit:
+                _, game_id = heapq.heappop(self.expiry)
+                entry = self._cached(game_id)
+                if entry is None:
+                    continue
+                if entry["last_active"] >= limit:
+                    # Touched since it was queued, requeue with its real time
+                    heapq.heappush(self.expiry, (entry["last_active"], game_id))
+                    continue
+                # Another worker may be playing it: only the store knows its last activity
+                if not self.store.delete_idle(game_id, limit):
+                    # Played elsewhere: our copy is stale, the next access reloads it
+                    self._drop(game_id)
+                    continue
+                self._drop(game_id)
+                self.log.forget(game_id)
+                self._notify("expired", game_id)
+                removed += 1
+        # Games of other workers (or from before a restart) expire in the store itself
+        for game_id in self.store.expire(limit):
+            self._drop(game_id)
+            self.log.forget(game_id)
+            self._notify("expired", game_id)
+            removed += 1
+        if removed:
+            self._notify("lobby", None)
+        return removed
+
+    def recover(self):
+        """
+        Crash recovery: reload the move log from disk and put back every game
+        the store lost (snapshot + replay). Returns how many were restored.
+        """
+        self.log.load()
+        restored = 0
+        for game_id in list(self.log.games):
+            if self.store.version(game_id) is not None:
+                continue
+            history = self.log.games[game_id]
+            game = self.log.rehydrate(game_id)
+            entry = {"type": history["type"], "players": history["players"], "last_active": time.time()}
+            self.store.save(game_id, self._record(entry, game), None)
+            # Cached and queued for expiry like a game played since the start
+            self.get_entry(game_id)
+            restored += 1
+        return restored
+
+    async def expire_forever(self, interval=60):
+        """Background task: run cleanup every `interval` seconds, in a thread (store round trips)."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.cleanup)
+            except Exception:
+                logger.exception("Expiring idle games failed")
 
 manager = GameManager()
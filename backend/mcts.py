@@ -0,0 +1,241 @@
+"""
+Monte Carlo Tree Search used by the "mcts" AI level.
+
+UCT on a Bitboard: every iteration walks down the tree picking the child
+with the best upper confidence bound, expands one untried move (captures
+first), plays a short greedy-random playout and backs the result up the
+path. The search is anytime: it stops at the time or iteration budget and
+plays the most visited root move.
+
+The tree is kept between turns. Every move applied to the game (the AI's
+own and the opponent's reply) goes through advance(), which promotes the
+matching child to root, so the next search starts from the visits already
+spent on that subtree instead of from scratch. A root whose position does
+not match the board (reset, move outside the tree) is simply dropped.
+"""
+import math
+import os
+import random
+import threading
+import time
+
+from bitboard import WHITE, OTHER
+
+# Defaults tuned with the arena against "initie": long random playouts drown the
+# evaluation in noise, a short greedy reply followed by the evaluation plays best.
+# Exploration constant of the UCT formula (results are between 0 and 1)
+MCTS_EXPLORATION = float(os.environ.get("AI_MCTS_EXPLORATION", 0.3))
+# Plies played by a playout before the position is scored by the evaluation
+MCTS_PLAYOUT_PLIES = int(os.environ.get("AI_MCTS_PLAYOUT_PLIES", 1))
+# Random moves drawn per playout ply, the one taking the most pieces is played
+MCTS_PLAYOUT_SAMPLE = int(os.environ.get("AI_MCTS_PLAYOUT_SAMPLE", 16))
+# Tree size limit, expansion stops beyond it (playouts go on)
+MCTS_MAX_NODES = int(os.environ.get("AI_MCTS_MAX_NODES", 200000))
+
+# Evaluation points for which a playout counts as ~73% won (one piece ahead)
+_EVAL_SCALE = 1000.0
+
+
+class Node:
+    __slots__ = ("move", "side", "key", "children", "untried", "visits", "wins")
+
+    def __init__(self, move, side, key):
+        self.move = move # (from, to) that led here, None at the root
+        self.side = side # side to move in this position
+        self.key = key # bb.key(side), checked when the node becomes the root
+        self.children = []
+        self.untried = None # moves not expanded yet, None until first visited
+        self.visits = 0
+        self.wins = 0.0 # results for the side that played `move`
+
+
+def _playout_result(bb):
+    """Result of the position for WHITE, between 0 and 1."""
+    winner = bb.winner()
+    if winner is not None:
+        return 1.0 if winner == WHITE else 0.0
+    return 1.0 / (1.0 + math.exp(-bb.evaluate(WHITE) / _EVAL_SCALE))
+
+
+def _random_bit(mask, rand):
+    """Index of a uniformly drawn set bit of `mask` (not 0)."""
+    for _ in range(int(rand() * mask.bit_count())):
+        mask &= mask - 1
+    return (mask & -mask).bit_length() - 1
+
+
+class MCTS:
+    CHECK_EVERY = 16 # iterations between two clock reads
+
+    def __init__(self, exploration=MCTS_EXPLORATION, playout_plies=MCTS_PLAYOUT_PLIES,
+                 sample=MCTS_PLAYOUT_SAMPLE, max_nodes=MCTS_MAX_NODES):
+        self.exploration = exploration
+        self.playout_plies = playout_plies
+        self.sample = sample
+        self.max_nodes = max_nodes
+        self.root = None
+        self.size = 0 # nodes in the tree (approximate once subtrees are dropped)
+        self.generation = 0 # bumped by advance(), a search started before it doesn't store its root
+        self.lock = threading.Lock()
+        self.last = {}
+
+    # --- Tree reuse ---
+
+    def advance(self, move):
+        """`move` (from, to) was played: its subtree becomes the root, or the tree is dropped."""
+        with self.lock:
+            self.generation += 1
+            root = self.root
+            self.root = None
+            if root is None:
+                return
+            for child in root.children:
+                if child.move == move:
+                    self.root = child
+                    self.size = self._count(child)
+                    return
+
+    def _count(self, node):
+        # Only run on promotion: a subtree's size is cheaper to recount than to track
+        stack, n = [node], 0
+        while stack:
+            node = stack.pop()
+            n += 1
+            stack.extend(node.children)
+        return n
+
+    # --- Search ---
+
+    def search(self, bb, player, time_budget=None, iterations=None, avoid=()):
+        """
+        Best (from, to) for `player` on `bb`, or None without a legal move.
+        Runs until `time_budget` seconds or `iterations` playouts (at least one).
+        """
+        start = time.perf_counter()
+        key = bb.key(player)
+        with self.lock:
+            generation = self.generation
+            root = self.root
+            if root is None or root.key != key:
+                root = Node(None, player, key)
+                self.size = 1
+        reused = root.visits
+        deadline = start + time_budget if time_budget else None
+        done = 0
+        max_depth = 0
+        while True:
+            max_depth = max(max_depth, self._iterate(bb, root))
+            done += 1
+            if iterations and done >= iterations:
+                break
+            if deadline is not None and done % self.CHECK_EVERY == 0 and time.perf_counter() >= deadline:
+                break
+            if not iterations and deadline is None:
+                break
+            if not root.untried and not root.children:
+                break # no legal move
+        move = self._choose(bb, root, avoid)
+        with self.lock:
+            if self.generation == generation:
+                self.root = root
+        elapsed = time.perf_counter() - start
+        self.last = {
+            "nodes": done,
+            "depth": max_depth,
+            "time": round(elapsed, 4),
+            "nps": int(done / elapsed) if elapsed else 0,
+            "reused": reused,
+            "tree": self.size,
+        }
+        return move
+
+    def _iterate(self, bb, root):
+        """One selection / expansion / playout / backup pass. Returns the depth reached."""
+        node = root
+        path = [node]
+        undo = []
+        # Selection
+        while not node.untried and node.children:
+            node = self._select(node)
+            f, t = node.move
+            mover = OTHER[node.side]
+            undo.append((mover, f, t, bb.make_move(mover, f, t)))
+            path.append(node)
+        # Expansion
+        if node.untried is None:
+            node.untried = self._untried(bb, node.side) if bb.winner() is None else []
+        if node.untried and self.size < self.max_nodes:
+            f, t = node.untried.pop()
+            side = node.side
+            undo.append((side, f, t, bb.make_move(side, f, t)))
+            child = Node((f, t), OTHER[side], bb.key(OTHER[side]))
+            node.children.append(child)
+            self.size += 1
+            node = child
+            path.append(node)
+        # Playout
+        result = self._playout(bb, node.side, undo)
+        for side, f, t, caps in reversed(undo):
+            bb.unmake_move(side, f, t, caps)
+        # Backup
+        for n in path:
+            n.visits += 1
+            n.wins += result if OTHER[n.side] == WHITE else 1.0 - result
+        return len(path) - 1
+
+    def _select(self, node):
+        log_n = math.log(node.visits)
+        c = self.exploration
+        best, best_value = None, -1.0
+        for child in node.children:
+            value = child.wins / child.visits + c * math.sqrt(log_n / child.visits)
+            if value > best_value:
+                best, best_value = child, value
+        return best
+
+    def _untried(self, bb, side):
+        # Popped from the end: captures (most pieces last) come out first
+        moves = bb.moves(side)
+        random.shuffle(moves)
+        moves.sort(key=lambda m: bb.move_captures(side, *m).bit_count())
+        return moves
+
+    def _playout(self, bb, side, undo):
+        """Greedy-random playout: each ply, the best capture among a few random moves."""
+        rand = random.random
+        for _ in range(self.playout_plies):
+            if bb.winner() is not None:
+                break
+            mine = bb.pieces[side]
+            empty = bb.empty()
+            best, best_caps = None, -1
+            for _ in range(self.sample):
+                f = _random_bit(mine, rand)
+                dest = bb.destinations(f, empty)
+                if not dest:
+                    continue
+                t = _random_bit(dest, rand)
+                caps = bb.move_captures(side, f, t).bit_count()
+                if caps > best_caps:
+                    best, best_caps = (f, t), caps
+            if best is None:
+                break
+            undo.append((side, best[0], best[1], bb.make_move(side, *best)))
+            side = OTHER[side]
+        return _playout_result(bb)
+
+    def _choose(self, bb, root, avoid):
+        """Most visited root move, skipping moves back into a recent position when possible."""
+        ranked = sorted(root.children, key=lambda c: c.visits, reverse=True)
+        for child in ranked:
+            f, t = child.move
+            caps = bb.make_move(root.side, f, t)
+            repeated = bb.snapshot() in avoid
+            bb.unmake_move(root.side, f, t, caps)
+            if not repeated:
+                return child.move
+        return ranked[0].move if ranked else None
+
+    def report(self):
+        return dict(self.last)
+
@@ -0,0 +1,183 @@
+"""
+Append-only move log.
+
+Every game's history is kept as a snapshot (Game.to_bytes) followed by the
+events played since. A new snapshot is taken at creation, on reset and
+every SNAPSHOT_EVERY events, so rehydrating a game is one from_bytes plus a
+short Game.replay of the tail. The full event list of each game stays in
+memory for analysis.
+
+With MOVE_LOG_DIR set, every record is also appended to segment files
+(segment-000001.log, ...), rolled over at MOVE_LOG_SEGMENT_BYTES. After a
+crash `load()` rebuilds the log from them; a record cut short by the crash
+is ignored. It then deletes the segments that only hold forgotten games, so
+restarts do not reread every segment ever written. Record layout, little
+endian:
+
+    length (H, payload bytes), kind (B), game id length (B), game id, payload
+
+    SNAPSHOT  type (B, 0 solo / 1 multi), players (B), Game.to_bytes(events=False)
+    EVENT     event id (I), 8-byte packed event (game.pack_event)
+    FORGET    empty, the game was deleted
+"""
+import os
+import struct
+import threading
+
+from game import Game, pack_event, unpack_event
+
+MOVE_LOG_DIR = os.environ.get("MOVE_LOG_DIR", "") # empty = memory only
+SNAPSHOT_EVERY = int(os.environ.get("MOVE_LOG_SNAPSHOT_EVERY", 32)) # events between snapshots
+MOVE_LOG_SEGMENT_BYTES = int(os.environ.get("MOVE_LOG_SEGMENT_BYTES", 16 * 1024 * 1024))
+
+SNAPSHOT, EVENT, FORGET = 1, 2, 3
+_RECORD = struct.Struct("<HBB")
+_EVENT_ID = struct.Struct("<I")
+_META = struct.Struct("<BB")
+_TYPES = ("solo", "multi")
+
+
+def _restart(history, data, game_type, players, last_event):
+    """Point the replay base of `history` at a new snapshot."""
+    if last_event is not None and last_event["type"] in ("reset", "fast_setup"):
+        # Markers only: replay starts from the snapshot taken after them
+        history["events"].append(last_event)
+    history.update(snapshot=data, type=game_type, players=players, base=len(history["events"]))
+
+
+class MoveLog:
+    def __init__(self, directory=MOVE_LOG_DIR, snapshot_every=SNAPSHOT_EVERY,
+                 segment_bytes=MOVE_LOG_SEGMENT_BYTES):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.segment_bytes = segment_bytes
+        # game_id -> {"snapshot": bytes, "type", "players", "events": [...], "base": index of the tail}
+        self.games = {}
+        self.lock = threading.Lock()
+        self.file = None
+        self.segment = 0
+
+    # --- Writing ---
+
+    def snapshot(self, game_id, game, game_type="solo", players=1):
+        data = game.to_bytes(events=False)
+        with self.lock:
+            _restart(self.games.setdefault(game_id, {"events": []}), data, game_type, players, game.last_event)
+            self._write(SNAPSHOT, game_id, _META.pack(_TYPES.index(game_type), players) + data)
+
+    def append(self, game_id, game):
+        """Log game.last_event (a place or move); snapshots the game every `snapshot_every` events."""
+        event = game.last_event
+        with self.lock:
+            history = self.games.get(game_id)
+            if history is None:
+                return
+            history["events"].append(event)
+            self._write(EVENT, game_id, _EVENT_ID.pack(event["id"]) + pack_event(event))
+            due = len(history["events"]) - history["base"] >= self.snapshot_every
+        if due:
+            self.snapshot(game_id, game, history["type"], history["players"])
+
+    def forget(self, game_id):
+        with self.lock:
+            if self.games.pop(game_id, None) is not None:
+                self._write(FORGET, game_id, b"")
+
+    def _write(self, kind, game_id, payload):
+        if not self.directory:
+            return
+        if self.file is None or self.file.tell() >= self.segment_bytes:
+            self._roll()
+        gid = game_id.encode()
+        self.file.write(_RECORD.pack(len(payload), kind, len(gid)) + gid + payload)
+        # Flushed to the OS on every record: survives a process crash (not a power loss)
+        self.file.flush()
+
+    def _roll(self):
+        if self.file is not None:
+            self.file.close()
+        os.makedirs(self.directory, exist_ok=True)
+        self.segment = max(self.segment, self._last_segment()) + 1
+        self.file = open(os.path.join(self.directory, f"segment-{self.segment:06d}.log"), "ab")
+
+    def _segments(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(f for f in os.listdir(self.directory) if f.startswith("segment-") and f.endswith(".log"))
+
+    def _last_segment(self):
+        segments = self._segments()
+        return int(segments[-1][8:14]) if segments else 0
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    # --- Reading ---
+
+    def history(self, game_id):
+        """Every event logged for the game, oldest first (reset / fast_setup included)."""
+        history = self.games.get(game_id)
+        return list(history["events"]) if history else []
+
+    def rehydrate(self, game_id):
+        """Rebuild the game: last snapshot + replay of the events since. None if unknown."""
+        history = self.games.get(game_id)
+        if history is None:
+            return None
+        game = Game.from_bytes(history["snapshot"])
+        return game.replay(history["events"][history["base"]:])
+
+    def load(self):
+        """Rebuild the in-memory log from the segment files (crash recovery)."""
+        games = {}
+        seen = {} # segment -> (game ids with records in it, game ids forgotten in it)
+        for name in self._segments():
+            with open(os.path.join(self.directory, name), "rb") as f:
+                data = f.read()
+            ids, forgotten = seen[name] = set(), set()
+            offset = 0
+            while offset + _RECORD.size <= len(data):
+                length, kind, id_len = _RECORD.unpack_from(data, offset)
+                start = offset + _RECORD.size
+                end = start + id_len + length
+                if end > len(data):
+                    break # torn write at the end of the segment
+                game_id = data[start:start + id_len].decode()
+                payload = data[start + id_len:end]
+                offset = end
+                ids.add(game_id)
+                if kind == SNAPSHOT:
+                    game_type, players = _META.unpack_from(payload)
+                    game_bytes = payload[_META.size:]
+                    _restart(games.setdefault(game_id, {"events": []}), game_bytes, _TYPES[game_type],
+                             players, Game.from_bytes(game_bytes).last_event)
+                elif kind == EVENT and game_id in games:
+                    event_id, = _EVENT_ID.unpack_from(payload)
+                    games[game_id]["events"].append(unpack_event(payload, _EVENT_ID.size, event_id))
+                elif kind == FORGET:
+                    games.pop(game_id, None)
+                    forgotten.add(game_id)
+        with self.lock:
+            self.games = games
+            self._compact(seen)
+        return len(games)
+
+    def _compact(self, seen):
+        """Delete the segments without a live game (lock held)."""
+        current = f"segment-{self.segment:06d}.log" if self.file is not None else None
+        kept, still_forgotten = set(), set()
+        dead = []
+        for name, (ids, forgotten) in seen.items():
+            if name == current or ids & self.games.keys():
+                kept |= ids
+                still_forgotten |= forgotten
+            else:
+                dead.append(name)
+        for name in dead:
+            os.remove(os.path.join(self.directory, name))
+        # A dead game still named in a kept segment must stay forgotten at the next load
+        for game_id in sorted(kept - self.games.keys() - still_forgotten):
+            self._write(FORGET, game_id, b"")
@@ -0,0 +1,140 @@
+"""
+Perft: count the leaf nodes of the move tree to a fixed depth.
+
+Two generators are counted and must agree:
+
+    fast       Bitboard.moves + make_move / unmake_move (what the search uses)
+    reference  the original rules on lists of lists, sharing no code with
+               the engine: the nested-loop walk of 1-2 steps through empty
+               cells, and check_capture's rule (opponent pieces next to the
+               moved piece with 3+ of the mover's pieces around them)
+
+A position where one side is down to fewer than 3 pieces is game over and
+counts as a leaf. Known-good counts live in perft_fixtures.json:
+
+    python perft.py                # check the fixtures, report moves/sec
+    python perft.py --reference    # check the reference generator too (slow)
+    python perft.py --depth 3      # count deeper than the fixtures go
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from bitboard import Bitboard, EMPTY, WHITE, BLACK, SIZE, other
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "perft_fixtures.json")
+_CELLS = {".": EMPTY, "W": WHITE, "B": BLACK}
+
+
+def perft(bb, side, depth):
+    if depth == 0 or bb.winner() is not None:
+        return 1
+    moves = bb.moves(side)
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    opp = other(side)
+    for f, t in moves:
+        captured = bb.make_move(side, f, t)
+        nodes += perft(bb, opp, depth - 1)
+        bb.unmake_move(side, f, t, captured)
+    return nodes
+
+
+_NEIGH = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+
+def _reference_moves(rows, side):
+    moves = set()
+    for x in range(SIZE):
+        for y in range(SIZE):
+            if rows[x][y] != side:
+                continue
+            for dx, dy in _NEIGH:
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < SIZE and 0 <= ny < SIZE and rows[nx][ny] == EMPTY:
+                    moves.add(((x, y), (nx, ny)))
+                    for ex, ey in _NEIGH:
+                        mx, my = nx + ex, ny + ey
+                        if 0 <= mx < SIZE and 0 <= my < SIZE and rows[mx][my] == EMPTY:
+                            moves.add(((x, y), (mx, my)))
+    return moves
+
+
+def _reference_captures(rows, x, y, side):
+    opponent = BLACK if side == WHITE else WHITE
+    captured = []
+    for dx, dy in _NEIGH:
+        i, j = x + dx, y + dy
+        if 0 <= i < SIZE and 0 <= j < SIZE and rows[i][j] == opponent:
+            count = sum(1 for ddx, ddy in _NEIGH
+                        if 0 <= i + ddx < SIZE and 0 <= j + ddy < SIZE and rows[i + ddx][j + ddy] == side)
+            if count >= 3:
+                captured.append((i, j))
+    return captured
+
+
+def perft_reference(rows, side, depth):
+    w = sum(row.count(WHITE) for row in rows)
+    b = sum(row.count(BLACK) for row in rows)
+    if depth == 0 or (w < 3) != (b < 3):
+        return 1
+    nodes = 0
+    for (fx, fy), (tx, ty) in _reference_moves(rows, side):
+        child = [row[:] for row in rows]
+        child[fx][fy] = EMPTY
+        child[tx][ty] = side
+        for cx, cy in _reference_captures(child, tx, ty, side):
+            child[cx][cy] = EMPTY
+        nodes += perft_reference(child, BLACK if side == WHITE else WHITE, depth - 1)
+    return nodes
+
+
+def load_fixtures(path=FIXTURES):
+    with open(path) as f:
+        return json.load(f)
+
+
+def board_rows(fixture):
+    """The fixture's board as lists of EMPTY / WHITE / BLACK."""
+    rows = [[_CELLS[c] for c in line] for line in fixture["board"]]
+    assert len(rows) == SIZE and all(len(r) == SIZE for r in rows)
+    return rows
+
+
+def position(fixture):
+    """(Bitboard, side to move) of a fixture."""
+    return Bitboard.from_rows(board_rows(fixture)), fixture["side"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft move-generator check and benchmark")
+    parser.add_argument("--depth", type=int, help="count to this depth instead of the fixture depths")
+    parser.add_argument("--reference", action="store_true", help="also count with the reference generator")
+    args = parser.parse_args()
+
+    failed = False
+    for fixture in load_fixtures():
+        counts = fixture["counts"]
+        depths = [args.depth] if args.depth else range(1, len(counts) + 1)
+        for depth in depths:
+            bb, side = position(fixture)
+            start = time.perf_counter()
+            nodes = perft(bb, side, depth)
+            elapsed = time.perf_counter() - start
+            expected = counts[depth - 1] if depth <= len(counts) else None
+            status = "" if expected is None else "ok" if nodes == expected else f"FAIL (expected {expected})"
+            line = f"{fixture['name']:<12} depth {depth}: {nodes:>10} nodes {nodes / elapsed:>12,.0f} moves/s {status}"
+            if args.reference:
+                ref = perft_reference(board_rows(fixture), side, depth)
+                line += " reference ok" if ref == nodes else f" reference FAIL ({ref})"
+                failed |= ref != nodes
+            failed |= expected is not None and nodes != expected
+            print(line)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Pondering: searching the AI's answers while the human thinks.
+
+Opt-in with AI_PONDER=1. After the AI moved in a solo game, start() runs a
+background task over the human's likely replies, best first (ranked like
+the initie level: pieces taken, then the evaluation). For each one it
+searches the AI's answer through the scheduler at background priority, so
+live requests always go first. Answers are cached by the position they
+answer (Zobrist key, side to move and level) and /play_ai plays a hit at
+once instead of searching.
+
+Bounds: PONDER_REPLIES replies per turn, PONDER_CACHE_SIZE answers in all
+(oldest dropped first). The task is cancelled when the human moves or the
+game is reset (stop()) and when GameManager.cleanup expires the game
+("expired" listener event). It also stops by itself once the game moved on.
+A search already dispatched runs to its end, which is why the scheduler
+keeps one slot away from background requests: pondering needs at least
+two search slots and stays off with one.
+"""
+import asyncio
+import os
+from collections import OrderedDict
+
+from bitboard import coords, other, square
+from game import Game, PHASE_MOVEMENT, rank_moves
+from scheduler import scheduler as ai_scheduler
+
+AI_PONDER = os.environ.get("AI_PONDER", "0") == "1"
+# Human replies searched per turn, most likely first
+PONDER_REPLIES = int(os.environ.get("AI_PONDER_REPLIES", 8))
+# Pondered answers kept, all games together
+PONDER_CACHE_SIZE = int(os.environ.get("AI_PONDER_CACHE_SIZE", 1024))
+# Levels worth pondering for: the cheap ones answer at once, mcts reuses its own tree
+PONDER_LEVELS = ("expert",)
+
+
+def likely_replies(bb, player):
+    """Moves of `player`, most likely first."""
+    moves = bb.moves(player)
+    if not moves:
+        return []
+    ranked = rank_moves(bb, player, moves)
+    return [m for _, m in sorted(zip(ranked, moves), key=lambda r: r[0], reverse=True)]
+
+
+class Ponderer:
+    def __init__(self, scheduler=ai_scheduler, enabled=AI_PONDER, replies=PONDER_REPLIES,
+                 cache_size=PONDER_CACHE_SIZE):
+        self.scheduler = scheduler
+        self.enabled = enabled
+        self.replies = replies
+        self.cache_size = cache_size
+        self.cache = OrderedDict() # (position key, level) -> (ai_move result, search stats)
+        self.tasks = {} # game_id -> asyncio.Task
+        self.loop = None # loop running the tasks, stop() hands over to it from other threads
+        self.hits = 0
+        self.misses = 0
+        self.searched = 0
+
+    def _key(self, game, player):
+        return game.bb.key(player), game.ai_difficulty
+
+    def start(self, game_id, game, ai_player):
+        """Ponder the replies to the AI's last move (call after the AI played)."""
+        if not self.enabled or game.phase != PHASE_MOVEMENT or game.ai_difficulty not in PONDER_LEVELS:
+            return
+        if game.bb.winner() is not None or self.scheduler.background_slots < 1:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.stop(game_id)
+        task = self.loop.create_task(self._ponder(game, game.event_id, ai_player))
+        self.tasks[game_id] = task
+        task.add_done_callback(lambda t: self.tasks.pop(game_id, None) if self.tasks.get(game_id) is t else None)
+
+    def stop(self, game_id):
+        """Cancel the game's pondering. Callable from any thread (sync endpoints run in the threadpool)."""
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is not loop:
+            loop.call_soon_threadsafe(self._stop, game_id)
+        else:
+            self._stop(game_id)
+
+    def _stop(self, game_id):
+        task = self.tasks.pop(game_id, None)
+        if task is not None:
+            task.cancel()
+
+    def listener(self, kind, game_id):
+        """Manager listener: stop pondering for expired games."""
+        if kind == "expired":
+            self.stop(game_id)
+
+    async def _ponder(self, game, event_id, ai_player):
+        base = game.to_bytes(events=False)
+        for f, t in likely_replies(game.bb, other(ai_player))[:self.replies]:
+            if game.event_id != event_id:
+                return # the human moved or the game was reset
+            child = Game.from_bytes(base).replay([(*coords(f), *coords(t))])
+            if child.bb.winner() is not None:
+                continue
+            key = self._key(child, ai_player)
+            if key in self.cache:
+                continue
+            move = await self.scheduler.ai_move(child, ai_player, background=True)
+            self.searched += 1
+            # No stats: the search fell back to the greedy move, not worth keeping
+            if move is not None and child.last_search is not None:
+                self.cache[key] = (move, child.last_search)
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+
+    def lookup(self, game_id, game, player):
+        """
+        The pondered answer for the current position as an ai_move result,
+        or None. Stops the game's pondering either way.
+        """
+        self.stop(game_id)
+        if not self.enabled or game.phase != PHASE_MOVEMENT or game.ai_difficulty not in PONDER_LEVELS:
+            return None
+        hit = self.cache.pop(self._key(game, player), None)
+        if hit is not None:
+            move, stats = hit
+            f, t = square(*move["from"]), square(*move["to"])
+            # Guard against key collisions, and the same position reached through another path
+            if game.bb.get(f) == player and game.bb.destinations(f) >> t & 1:
+                bb = game.bb.copy()
+                bb.make_move(player, f, t)
+                if bb.snapshot() not in game.recent_positions:
+                    self.hits += 1
+                    game.last_search = dict(stats, pondered=True)
+                    return move
+        self.misses += 1
+        return None
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "pondering": len(self.tasks),
+            "cached": len(self.cache),
+            "searched": self.searched,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+ponderer = Ponderer()
@@ -0,0 +1,211 @@
+"""
+AI move scheduler.
+
+/play_ai hands its AI turns to the scheduler rather than to the pool:
+
+  - cheap levels (INLINE_LEVELS) and placement moves are answered at once,
+    they never wait behind a search;
+  - the other levels are queued per difficulty and dispatched to at most
+    AI_SEARCH_SLOTS concurrent searches, whenever slots free up, taking the
+    queues in turn so one busy level cannot starve another;
+  - every request has a deadline (AI_MOVE_TIMEOUT after it arrived): a
+    request still queued at its deadline gets the greedy move, a running
+    one only gets the time it has left;
+  - background requests (pondering, see ponder.py) are only dispatched
+    when no other request is queued, and never take the last free worker
+    slot: a search cannot be taken back once dispatched, so a live request
+    always finds a slot that background work cannot hold;
+  - levels searched in a thread of the server (THREAD_LEVELS) do not use
+    the worker slots but have their own, AI_THREAD_SEARCHES.
+
+Queue depth, running searches and wait times per level are reported by
+stats() (see /ai/stats).
+"""
+import asyncio
+import os
+from collections import deque
+
+from ai_pool import pool as ai_pool, INLINE_LEVELS, THREAD_LEVELS, AI_THREAD_SEARCHES
+from game import PHASE_MOVEMENT
+
+# Concurrent searches, 0 = one per worker (one per AI_PARALLEL_WORKERS group when root splitting)
+AI_SEARCH_SLOTS = int(os.environ.get("AI_SEARCH_SLOTS", 0))
+# Waits kept per level for the percentiles
+WAIT_SAMPLES = 1000
+# Queue (and stats entry) of the background requests
+BACKGROUND = "background"
+
+
+class LevelStats:
+    def __init__(self):
+        self.requests = 0
+        self.served = 0
+        self.expired = 0 # deadline reached while queued
+        self.stale = 0 # the game moved on while queued, not searched
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+        self.max_wait = 0.0
+
+    def record_wait(self, seconds):
+        self.waits.append(seconds)
+        self.max_wait = max(self.max_wait, seconds)
+
+    def summary(self, queued, running):
+        waits = sorted(self.waits)
+        return {
+            "requests": self.requests,
+            "served": self.served,
+            "expired": self.expired,
+            "stale": self.stale,
+            "queued": queued,
+            "running": running,
+            "avg_wait_ms": round(1000 * sum(waits) / len(waits), 2) if waits else 0.0,
+            "p99_wait_ms": round(1000 * waits[min(len(waits) - 1, int(len(waits) * 0.99))], 2) if waits else 0.0,
+            "max_wait_ms": round(1000 * self.max_wait, 2),
+        }
+
+
+class _Request:
+    __slots__ = ("game", "player", "level", "event_id", "future", "arrived", "deadline", "timer")
+
+    def __init__(self, game, player, future, arrived, deadline, level):
+        self.game = game
+        self.player = player
+        self.level = level
+        self.event_id = game.event_id
+        self.future = future
+        self.arrived = arrived
+        self.deadline = deadline
+        self.timer = None
+
+
+def _resolve(future, move):
+    # The awaiting request may have been cancelled (client gone)
+    if not future.done():
+        future.set_result(move)
+
+
+class AIScheduler:
+    def __init__(self, pool=ai_pool, slots=AI_SEARCH_SLOTS, thread_slots=AI_THREAD_SEARCHES):
+        self.pool = pool
+        self.slots = slots or max(1, pool.workers // max(1, pool.parallel))
+        self.thread_slots = thread_slots
+        self.queues = {} # level -> deque of _Request, oldest first
+        self.running = {} # level -> searches in flight
+        self.levels = {} # level -> LevelStats
+        self.tasks = set()
+        self._turn = 0 # round-robin position over the levels
+
+    def _stats(self, level):
+        stats = self.levels.get(level)
+        if stats is None:
+            stats = self.levels[level] = LevelStats()
+        return stats
+
+    async def ai_move(self, game, player, timeout=None, background=False):
+        """
+        The AI move for `game`, within `timeout` seconds of the call (default:
+        the pool's). `background` requests yield to every other one.
+        """
+        level = BACKGROUND if background else game.ai_difficulty
+        stats = self._stats(level)
+        stats.requests += 1
+        if game.phase != PHASE_MOVEMENT or game.ai_difficulty in INLINE_LEVELS:
+            stats.record_wait(0.0)
+            stats.served += 1
+            return game.ai_move(player)
+
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        request = _Request(game, player, loop.create_future(), now,
+                           now + (self.pool.timeout if timeout is None else timeout), level)
+        request.timer = loop.call_at(request.deadline, self._expire, request)
+        self.queues.setdefault(request.level, deque()).append(request)
+        self._dispatch()
+        return await request.future
+
+    def _expire(self, request):
+        queue = self.queues.get(request.level)
+        if queue is None or request not in queue:
+            return # already dispatched
+        queue.remove(request)
+        stats = self._stats(request.level)
+        stats.expired += 1
+        stats.served += 1
+        stats.record_wait(asyncio.get_running_loop().time() - request.arrived)
+        if not request.future.done():
+            # Nobody waits on a background answer, a greedy move is of no use there
+            move = None if request.level == BACKGROUND else self.pool.fallback(request.game, request.player)
+            _resolve(request.future, move)
+
+    def _has_slot(self, level):
+        threaded = level in THREAD_LEVELS
+        busy = sum(n for lvl, n in self.running.items() if (lvl in THREAD_LEVELS) == threaded)
+        if level == BACKGROUND:
+            return busy < self.slots and self.running.get(BACKGROUND, 0) < self.background_slots
+        return busy < (self.thread_slots if threaded else self.slots)
+
+    @property
+    def background_slots(self):
+        return self.slots - 1
+
+    def _next_request(self):
+        """Oldest live request of the next level in turn that has a free slot, or None."""
+        while True:
+            levels = [level for level, queue in self.queues.items()
+                      if queue and level != BACKGROUND and self._has_slot(level)]
+            if not levels and self.queues.get(BACKGROUND) and self._has_slot(BACKGROUND):
+                levels = [BACKGROUND]
+            if not levels:
+                return None
+            level = levels[self._turn % len(levels)]
+            self._turn += 1
+            request = self.queues[level].popleft()
+            request.timer.cancel()
+            if request.future.done():
+                continue # cancelled by the caller
+            if request.game.event_id != request.event_id:
+                # /play_ai would drop the move anyway
+                stats = self._stats(level)
+                stats.stale += 1
+                stats.served += 1
+                _resolve(request.future, None)
+                continue
+            return request
+
+    def _dispatch(self):
+        while True:
+            request = self._next_request()
+            if request is None:
+                return
+            self.running[request.level] = self.running.get(request.level, 0) + 1
+            task = asyncio.get_running_loop().create_task(self._run(request))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, request):
+        loop = asyncio.get_running_loop()
+        stats = self._stats(request.level)
+        stats.record_wait(loop.time() - request.arrived)
+        try:
+            move = await self.pool.search(request.game, request.player, max(0.0, request.deadline - loop.time()))
+            _resolve(request.future, move)
+        except Exception as exc:
+            if not request.future.done():
+                request.future.set_exception(exc)
+        finally:
+            self.running[request.level] -= 1
+            stats.served += 1
+            self._dispatch()
+
+    def stats(self):
+        return {
+            "slots": self.slots,
+            "thread_slots": self.thread_slots,
+            "running": sum(self.running.values()),
+            "queued": sum(len(q) for q in self.queues.values()),
+            "levels": {level: s.summary(len(self.queues.get(level, ())), self.running.get(level, 0))
+                       for level, s in self.levels.items()},
+        }
+
+
+scheduler = AIScheduler()
@@ -0,0 +1,434 @@
+"""
+Alpha-beta search used by the expert AI.
+
+The search runs in negamax form on a Bitboard and caches its results in a
+transposition table keyed on the bitboard's Zobrist hash.
+
+At the horizon a quiescence search keeps playing capturing moves only
+(QUIESCENCE_DEPTH plies at most), so a leaf is never scored in the middle
+of an exchange. Moves after the first one of a node are searched with a
+null window (principal variation search) and only re-searched when they
+turn out better. Iterative deepening can also open each iteration with an
+aspiration window around the previous score (AI_ASPIRATION_WINDOW): off by
+default, the score moves too much between iterations here and the
+re-searches cost more than the narrow window saves.
+"""
+import os
+import time
+
+from bitboard import WHITE, BLACK, CELLS, WIN_SCORE, other
+
+EXACT = 0
+LOWER = 1 # score is a lower bound (fail high)
+UPPER = 2 # score is an upper bound (fail low)
+
+INF = float('inf')
+
+MAX_PLY = 64
+
+# Plies of captures searched past the horizon, 0 = plain evaluation at depth 0
+QUIESCENCE_DEPTH = int(os.environ.get("AI_QUIESCENCE_DEPTH", 4))
+# Half width of the aspiration window around the previous iteration's score, 0 = off
+ASPIRATION_WINDOW = int(os.environ.get("AI_ASPIRATION_WINDOW", 0))
+
+# Move ordering priorities (higher is searched first)
+_ORDER_HASH = 1 << 40
+_ORDER_CAPTURE = 1 << 32
+_ORDER_KILLER = 1 << 31
+
+# Scores depend on who the search is run for (the evaluation is not
+# symmetric), so the root player is part of the table key.
+_ROOT_KEY = {WHITE: 0, BLACK: 0x5BD1E9955BD1E995}
+
+
+class TranspositionTable:
+    """
+    Fixed-size hash table of search results, one entry per slot.
+
+    Replacement policy: an entry from an older search is always replaced,
+    otherwise the deeper result wins (ties go to the newest one).
+    """
+
+    def __init__(self, size=1 << 18):
+        # Round to a power of two so the slot index is a mask
+        self.size = 1 << max(1, int(size) - 1).bit_length()
+        self.mask = self.size - 1
+        self.slots = [None] * self.size
+        self.generation = 0
+        self.used = 0 # occupied slots, kept up to date so stats() needs no scan
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def new_search(self):
+        """Age existing entries so they lose priority to the coming search."""
+        self.generation = (self.generation + 1) & 0xFFFF
+
+    def clear(self):
+        self.slots = [None] * self.size
+        self.used = 0
+
+    def probe(self, key):
+        """Returns (depth, score, flag, best_move) or None."""
+        entry = self.slots[key & self.mask]
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] != key:
+            self.collisions += 1
+            return None
+        self.hits += 1
+        return entry[1:5]
+
+    def store(self, key, depth, score, flag, best_move):
+        idx = key & self.mask
+        old = self.slots[idx]
+        if old is not None:
+            if old[0] == key or old[5] != self.generation or depth >= old[1]:
+                if old[0] != key:
+                    self.overwrites += 1
+            else:
+                return
+        else:
+            self.used += 1
+        self.slots[idx] = (key, depth, score, flag, best_move, self.generation)
+        self.stores += 1
+
+    def stats(self):
+        used = self.used
+        probes = self.hits + self.misses + self.collisions
+        return {
+            "size": self.size,
+            "used": used,
+            "fill": used / self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "collisions": self.collisions,
+            "hit_rate": self.hits / probes if probes else 0.0,
+            "stores": self.stores,
+            "overwrites": self.overwrites,
+        }
+
+
+# One table per process, shared by every game (keys include the position)
+TT = TranspositionTable(int(os.environ.get("AI_TT_SIZE", 1 << 18)))
+
+
+class SearchTimeout(Exception):
+    """Raised inside the tree when the time or node budget is spent."""
+
+
+class Searcher:
+    """Negamax alpha-beta search for `player` (the side to move at the root)."""
+
+    CHECK_EVERY = 256 # nodes between two clock reads
+
+    def __init__(self, player, tt=TT, quiescence=QUIESCENCE_DEPTH, aspiration=ASPIRATION_WINDOW):
+        self.root = player
+        self.tt = tt
+        self.quiescence = quiescence
+        self.aspiration = aspiration
+        self.nodes = 0
+        self.pv = []
+        self.deadline = None
+        self.node_limit = None
+        # Two killer moves per ply, history counters per (side, from, to)
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.history = [None, [0] * (CELLS * CELLS), [0] * (CELLS * CELLS)]
+        # Nodes spent under each root move in the last iteration
+        self.root_nodes = {}
+        self.qnodes = 0 # quiescence nodes (included in nodes)
+        self.researches = 0 # null-window and aspiration re-searches
+
+    def leaf(self, bb, side):
+        # Evaluation is always done for the root player, negated on its opponent's turn
+        v = bb.evaluate(self.root)
+        return v if side == self.root else -v
+
+    def key(self, bb, side):
+        return bb.key(side) ^ _ROOT_KEY[self.root]
+
+    def check_budget(self):
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchTimeout()
+        if self.deadline is not None and self.nodes % self.CHECK_EVERY == 0:
+            if time.perf_counter() >= self.deadline:
+                raise SearchTimeout()
+
+    def order_moves(self, bb, moves, side, ply, first=None):
+        """
+        Sort `moves` in place: hash/PV move, then captures (most pieces taken
+        first), then the killer moves of this ply, then by history score.
+        """
+        killers = self.killers[ply] if ply < MAX_PLY else (None, None)
+        history = self.history[side]
+
+        def priority(move):
+            if move == first: return _ORDER_HASH
+            f, t = move
+            caps = bb.move_captures(side, f, t)
+            if caps: return _ORDER_CAPTURE + caps.bit_count()
+            if move == killers[0]: return _ORDER_KILLER + 1
+            if move == killers[1]: return _ORDER_KILLER
+            return history[f * CELLS + t]
+
+        moves.sort(key=priority, reverse=True)
+
+    def record_cutoff(self, bb, move, side, ply, depth):
+        """A quiet move caused a beta cutoff: remember it as killer and in the history."""
+        f, t = move
+        if bb.move_captures(side, f, t): return
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
+        self.history[side][f * CELLS + t] += depth * depth
+
+    def negamax(self, bb, depth, side, alpha, beta, ply=1):
+        self.nodes += 1
+        self.check_budget()
+        alpha_orig = alpha
+        key = self.key(bb, side)
+
+        tt_move = None
+        entry = self.tt.probe(key)
+        if entry is not None:
+            e_depth, e_score, e_flag, tt_move = entry
+            if e_depth >= depth:
+                if e_flag == EXACT: return e_score
+                if e_flag == LOWER: alpha = max(alpha, e_score)
+                else: beta = min(beta, e_score)
+                if alpha >= beta: return e_score
+
+        if bb.winner():
+            return self.leaf(bb, side)
+        if depth == 0:
+            return self.quiesce(bb, side, alpha, beta, self.quiescence)
+
+        moves = bb.moves(side)
+        if not moves: return self.leaf(bb, side)
+
+        # The table's best move (or the previous iteration's PV) goes first
+        first = tt_move
+        if first is None and ply < len(self.pv):
+            first = self.pv[ply]
+        self.order_moves(bb, moves, side, ply, first)
+
+        best = -INF
+        best_move = None
+        opp = other(side)
+        for f, t in moves:
+            caps = bb.make_move(side, f, t)
+            try:
+                if best_move is None or alpha == -INF:
+                    score = -self.negamax(bb, depth - 1, opp, -beta, -alpha, ply + 1)
+                else:
+                    # PVS: prove the move is no better than alpha, search it fully only if it is
+                    score = -self.negamax(bb, depth - 1, opp, -alpha - 1, -alpha, ply + 1)
+                    if alpha < score < beta:
+                        self.researches += 1
+                        score = -self.negamax(bb, depth - 1, opp, -beta, -alpha, ply + 1)
+            finally:
+                bb.unmake_move(side, f, t, caps)
+
+            if score > best:
+                best = score
+                best_move = (f, t)
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                self.record_cutoff(bb, (f, t), side, ply, depth)
+                break
+
+        if best <= alpha_orig: flag = UPPER
+        elif best >= beta: flag = LOWER
+        else: flag = EXACT
+        self.tt.store(key, depth, best, flag, best_move)
+        return best
+
+    def quiesce(self, bb, side, alpha, beta, qdepth):
+        """Captures-only search past the horizon, standing pat on the evaluation."""
+        stand_pat = self.leaf(bb, side)
+        if qdepth == 0 or stand_pat >= beta or bb.winner():
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+        moves = bb.capture_moves(side)
+        if not moves:
+            return stand_pat
+        moves.sort(key=lambda m: bb.move_captures(side, *m).bit_count(), reverse=True)
+        best = stand_pat
+        opp = other(side)
+        for f, t in moves:
+            # The horizon node itself was counted by negamax, count the captures past it
+            self.nodes += 1
+            self.qnodes += 1
+            self.check_budget()
+            caps = bb.make_move(side, f, t)
+            try:
+                score = -self.quiesce(bb, opp, -beta, -alpha, qdepth - 1)
+            finally:
+                bb.unmake_move(side, f, t, caps)
+            if score > best:
+                best = score
+                alpha = max(alpha, score)
+                if alpha >= beta:
+                    break
+        return best
+
+    def search_root(self, bb, depth, avoid=(), moves=None, shared_alpha=None, alpha=-INF, beta=INF):
+        """
+        Search `depth` plies from the root and return (best_move, score).
+        Moves leading to a position in `avoid` are penalised (loop prevention).
+
+        `moves` restricts the search to a slice of the root moves (searched in
+        the given order) and `shared_alpha` lets several processes searching
+        different slices raise each other's alpha (see ai_pool). A score
+        outside (alpha, beta) is only a bound (aspiration window failed).
+        """
+        if moves is None:
+            moves = bb.moves(self.root)
+            self.order_moves(bb, moves, self.root, 0, self.pv[0] if self.pv else None)
+        if not moves: return None, None
+
+        opp = other(self.root)
+        best_val = -INF
+        best_move = None
+        self.root_nodes = {}
+        self.root_scores = {}
+        self.root_exact = set() # moves whose score is exact, the others' are only bounds
+        for f, t in moves:
+            if shared_alpha is not None:
+                alpha = max(alpha, shared_alpha.get())
+            nodes_before = self.nodes
+            caps = bb.make_move(self.root, f, t)
+            try:
+                penalty = 500 if bb.snapshot() in avoid else 0 # Strong deterrent
+                if best_move is None or alpha == -INF:
+                    val = -self.negamax(bb, depth - 1, opp, -beta - penalty, -alpha - penalty) - penalty
+                else:
+                    val = -self.negamax(bb, depth - 1, opp, -alpha - 1 - penalty, -alpha - penalty) - penalty
+                    if alpha < val < beta:
+                        self.researches += 1
+                        val = -self.negamax(bb, depth - 1, opp, -beta - penalty, -alpha - penalty) - penalty
+            finally:
+                bb.unmake_move(self.root, f, t, caps)
+                self.root_nodes[(f, t)] = self.nodes - nodes_before
+
+            self.root_scores[(f, t)] = val
+            if alpha < val < beta:
+                self.root_exact.add((f, t))
+
+            if val > best_val:
+                best_val = val
+                best_move = (f, t)
+                if val > alpha:
+                    alpha = val
+                    if shared_alpha is not None:
+                        shared_alpha.raise_to(val)
+                if val >= beta:
+                    break
+        return best_move, best_val
+
+    def search(self, bb, depth, avoid=()):
+        """Fixed-depth search, no budget."""
+        self.tt.new_search()
+        return self.search_root(bb, depth, avoid)
+
+    def principal_variation(self, bb, first_move, depth):
+        """Follow the table's best moves from the root to rebuild the PV."""
+        pv = [first_move]
+        side = self.root
+        undo = []
+        move = first_move
+        while move is not None and len(pv) <= depth:
+            f, t = move
+            undo.append((side, f, t, bb.make_move(side, f, t)))
+            side = other(side)
+            entry = self.tt.probe(self.key(bb, side))
+            move = entry[3] if entry is not None else None
+            if move is not None:
+                if not (bb.pieces[side] >> move[0] & 1 and bb.destinations(move[0]) >> move[1] & 1):
+                    break
+                pv.append(move)
+        for side, f, t, caps in reversed(undo):
+            bb.unmake_move(side, f, t, caps)
+        return pv[:depth]
+
+    def search_aspirated(self, bb, depth, avoid, guess):
+        """search_root in a window around `guess`, searched again in full if the score falls outside."""
+        if guess is None or not self.aspiration or abs(guess) >= WIN_SCORE:
+            return self.search_root(bb, depth, avoid)
+        alpha, beta = guess - self.aspiration, guess + self.aspiration
+        move, score = self.search_root(bb, depth, avoid, alpha=alpha, beta=beta)
+        if move is None or alpha < score < beta:
+            return move, score
+        self.researches += 1
+        return self.search_root(bb, depth, avoid)
+
+    def iterative_deepening(self, bb, max_depth, time_budget=None, node_budget=None, avoid=()):
+        """
+        Search depth 1, 2, 3... up to `max_depth` until the time (seconds) or node
+        budget is spent. Returns (best_move, score, depth) of the last complete
+        iteration. Depth 1 always completes so there is always a move to play.
+
+        Quiescence has no bound of its own (a capture sequence can run long),
+        so with it on the move that is always there comes from a plain depth 1
+        search first, and every quiescent iteration runs under the budget.
+        """
+        self.tt.new_search()
+        start = time.perf_counter()
+        best = (None, None, 0)
+        self.depth_nodes = []
+        guarded = False
+        if self.quiescence and (time_budget or node_budget):
+            saved, self.quiescence = self.quiescence, 0
+            try:
+                move, score = self.search_root(bb, 1, avoid)
+            finally:
+                self.quiescence = saved
+            if move is None:
+                return best
+            best = (move, score, 1)
+            self.pv = [move]
+            guarded = True
+        for depth in range(1, max_depth + 1):
+            if depth > 1 or guarded:
+                self.deadline = start + time_budget if time_budget else None
+                self.node_limit = node_budget or None
+            try:
+                move, score = self.search_aspirated(bb, depth, avoid, best[1] if depth > 1 else None)
+            except SearchTimeout:
+                break
+            finally:
+                self.deadline = None
+                self.node_limit = None
+            if move is None:
+                break
+            best = (move, score, depth)
+            self.depth_nodes.append(self.nodes)
+            self.pv = self.principal_variation(bb, move, depth)
+            if abs(score) >= WIN_SCORE:
+                break # forced result found, deeper search won't change it
+            if time_budget and time.perf_counter() - start >= time_budget:
+                break
+        self.elapsed = time.perf_counter() - start
+        self.depth = best[2]
+        return best
+
+    def report(self):
+        """Search statistics of the last iterative_deepening call."""
+        elapsed = getattr(self, "elapsed", 0.0)
+        return {
+            "nodes": self.nodes,
+            "qnodes": self.qnodes,
+            "researches": self.researches,
+            "depth": getattr(self, "depth", 0),
+            "nodes_per_depth": list(getattr(self, "depth_nodes", [])),
+            "time": round(elapsed, 4),
+            "nps": int(self.nodes / elapsed) if elapsed else 0,
+        }
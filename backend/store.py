@@ -0,0 +1,354 @@
+"""
+Game stores.
+
+The GameManager keeps live games in memory but writes every change through
+to a store, so games survive restarts and several uvicorn workers can serve
+the same game. A record is a dict:
+
+    {"data": Game.to_bytes(), "version": event_id, "type": "solo"|"multi",
+     "players": n, "last_active": timestamp}
+
+Writes are optimistic: `save` takes the version the caller last saw and
+raises VersionConflict when the stored record has moved on (another worker
+played in the meantime). `expected=None` creates the record and conflicts
+if it already exists. `delete_idle` only deletes a game nobody touched
+since a given time, for expiry decided on one worker's cached view.
+
+Backends, picked with GAME_STORE:
+    memory                  process-local (default, single worker)
+    sqlite:///path/games.db shared by the workers of one host
+    redis://host:6379/0     any server speaking the Redis protocol
+"""
+import socket
+import sqlite3
+import threading
+from urllib.parse import urlparse
+
+from database import ConnectionPool
+
+
+class VersionConflict(Exception):
+    """The game was changed by someone else since it was loaded."""
+
+
+def _is_waiting(record):
+    return record["type"] == "multi" and record["players"] < 2
+
+
+class MemoryStore:
+    def __init__(self):
+        self.records = {}
+        self.waiting_ids = {} # game_id -> None, waiting multi games (insertion ordered)
+        self.lock = threading.Lock()
+
+    def load(self, game_id):
+        record = self.records.get(game_id)
+        return dict(record) if record is not None else None
+
+    def version(self, game_id):
+        record = self.records.get(game_id)
+        return record["version"] if record is not None else None
+
+    def save(self, game_id, record, expected):
+        with self.lock:
+            current = self.records.get(game_id)
+            if (current["version"] if current else None) != expected:
+                raise VersionConflict(game_id)
+            self.records[game_id] = dict(record)
+            if _is_waiting(record):
+                self.waiting_ids.setdefault(game_id, None)
+            else:
+                self.waiting_ids.pop(game_id, None)
+
+    def delete(self, game_id):
+        with self.lock:
+            self.records.pop(game_id, None)
+            self.waiting_ids.pop(game_id, None)
+
+    def delete_idle(self, game_id, limit):
+        with self.lock:
+            record = self.records.get(game_id)
+            if record is not None and record["last_active"] >= limit:
+                return False
+            self.records.pop(game_id, None)
+            self.waiting_ids.pop(game_id, None)
+            return True
+
+    def waiting(self):
+        with self.lock:
+            return list(self.waiting_ids)
+
+    def expire(self, limit):
+        # Process-local: every game is also in the manager's expiry heap, which deletes it
+        return []
+
+    def close(self):
+        pass
+
+
+class SQLiteStore:
+    def __init__(self, path):
+        self.pool = ConnectionPool(path)
+        with self.pool.connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS games (
+                    game_id TEXT PRIMARY KEY,
+                    data BLOB NOT NULL,
+                    version INTEGER NOT NULL,
+                    type TEXT NOT NULL,
+                    players INTEGER NOT NULL,
+                    last_active REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_games_active ON games (last_active)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_games_waiting ON games (type, players)")
+            conn.commit()
+
+    def load(self, game_id):
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT data, version, type, players, last_active FROM games WHERE game_id = ?",
+                (game_id,)).fetchone()
+        if row is None:
+            return None
+        return {"data": row[0], "version": row[1], "type": row[2], "players": row[3], "last_active": row[4]}
+
+    def version(self, game_id):
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT version FROM games WHERE game_id = ?", (game_id,)).fetchone()
+        return row[0] if row else None
+
+    def save(self, game_id, record, expected):
+        values = (record["data"], record["version"], record["type"], record["players"], record["last_active"])
+        with self.pool.connection() as conn:
+            if expected is None:
+                try:
+                    conn.execute(
+                        "INSERT INTO games (data, version, type, players, last_active, game_id) VALUES (?, ?, ?, ?, ?, ?)",
+                        values + (game_id,))
+                except sqlite3.IntegrityError:
+                    conn.rollback()
+                    raise VersionConflict(game_id)
+            else:
+                cur = conn.execute(
+                    "UPDATE games SET data = ?, version = ?, type = ?, players = ?, last_active = ?"
+                    " WHERE game_id = ? AND version = ?",
+                    values + (game_id, expected))
+                if cur.rowcount != 1:
+                    conn.rollback()
+                    raise VersionConflict(game_id)
+            conn.commit()
+
+    def delete(self, game_id):
+        with self.pool.connection() as conn:
+            conn.execute("DELETE FROM games WHERE game_id = ?", (game_id,))
+            conn.commit()
+
+    def delete_idle(self, game_id, limit):
+        with self.pool.connection() as conn:
+            conn.execute("DELETE FROM games WHERE game_id = ? AND last_active < ?", (game_id, limit))
+            kept = conn.execute("SELECT 1 FROM games WHERE game_id = ?", (game_id,)).fetchone()
+            conn.commit()
+        return kept is None
+
+    def waiting(self):
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT game_id FROM games WHERE type = 'multi' AND players < 2 ORDER BY rowid").fetchall()
+        return [r[0] for r in rows]
+
+    def expire(self, limit):
+        with self.pool.connection() as conn:
+            rows = conn.execute("SELECT game_id FROM games WHERE last_active < ?", (limit,)).fetchall()
+            conn.execute("DELETE FROM games WHERE last_active < ?", (limit,))
+            conn.commit()
+        return [r[0] for r in rows]
+
+    def close(self):
+        self.pool.close()
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisConnection:
+    """
+    Minimal RESP client: one socket, commands serialized by a lock.
+
+    Any socket error or timeout closes the connection and is raised: a reply
+    that comes late would otherwise be read as the answer to the next
+    command. The next command opens a new connection.
+    """
+
+    def __init__(self, host="localhost", port=6379, db=0, timeout=5):
+        self.address = (host, port)
+        self.db = db
+        self.timeout = timeout
+        self.sock = None
+        self.file = None
+        self.lock = threading.RLock()
+        self._connect()
+
+    def _connect(self):
+        self.sock = socket.create_connection(self.address, timeout=self.timeout)
+        self.file = self.sock.makefile("rb")
+        if self.db:
+            self.sock.sendall(self._encode(("SELECT", self.db)))
+            self._read()
+
+    def execute(self, *args):
+        with self.lock:
+            try:
+                if self.sock is None:
+                    self._connect()
+                self.sock.sendall(self._encode(args))
+                return self._read()
+            except OSError:
+                # socket.timeout and ConnectionError included: the stream is out of sync
+                self.close()
+                raise
+
+    @staticmethod
+    def _encode(args):
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(out)
+
+    def _read(self):
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            n = int(rest)
+            if n < 0:
+                return None
+            data = self.file.read(n + 2)
+            return data[:-2]
+        if kind == b"*":
+            n = int(rest)
+            if n < 0:
+                return None
+            return [self._read() for _ in range(n)]
+        raise RedisError(f"Unexpected reply {line!r}")
+
+    def close(self):
+        with self.lock:
+            if self.sock is not None:
+                self.file.close()
+                self.sock.close()
+                self.sock = self.file = None
+
+
+class RedisStore:
+    """
+    One hash per game (game:<id>), a sorted set of last activity times for
+    expiry and one of creation times for the lobby. Saves are a
+    WATCH / check version / MULTI ... EXEC round, EXEC returning nil means
+    the key changed under us.
+    """
+
+    def __init__(self, host="localhost", port=6379, db=0):
+        self.conn = RedisConnection(host, port, db)
+
+    @staticmethod
+    def _key(game_id):
+        return f"game:{game_id}"
+
+    def load(self, game_id):
+        reply = self.conn.execute("HGETALL", self._key(game_id))
+        if not reply:
+            return None
+        fields = dict(zip(reply[::2], reply[1::2]))
+        return {
+            "data": fields[b"data"],
+            "version": int(fields[b"version"]),
+            "type": fields[b"type"].decode(),
+            "players": int(fields[b"players"]),
+            "last_active": float(fields[b"last_active"]),
+        }
+
+    def version(self, game_id):
+        v = self.conn.execute("HGET", self._key(game_id), "version")
+        return int(v) if v is not None else None
+
+    def save(self, game_id, record, expected):
+        key = self._key(game_id)
+        # WATCH is per connection: the whole check-and-set must not interleave with other commands
+        with self.conn.lock:
+            self.conn.execute("WATCH", key)
+            current = self.conn.execute("HGET", key, "version")
+            if (int(current) if current is not None else None) != expected:
+                self.conn.execute("UNWATCH")
+                raise VersionConflict(game_id)
+            self.conn.execute("MULTI")
+            self.conn.execute("HSET", key,
+                              "data", record["data"], "version", record["version"],
+                              "type", record["type"], "players", record["players"],
+                              "last_active", repr(record["last_active"]))
+            self.conn.execute("ZADD", "games:active", repr(record["last_active"]), game_id)
+            if _is_waiting(record):
+                if expected is None:
+                    self.conn.execute("ZADD", "games:waiting", repr(record["last_active"]), game_id)
+            else:
+                self.conn.execute("ZREM", "games:waiting", game_id)
+            if self.conn.execute("EXEC") is None:
+                raise VersionConflict(game_id)
+
+    def delete(self, game_id):
+        with self.conn.lock:
+            self.conn.execute("MULTI")
+            self.conn.execute("DEL", self._key(game_id))
+            self.conn.execute("ZREM", "games:active", game_id)
+            self.conn.execute("ZREM", "games:waiting", game_id)
+            self.conn.execute("EXEC")
+
+    def delete_idle(self, game_id, limit):
+        key = self._key(game_id)
+        with self.conn.lock:
+            self.conn.execute("WATCH", key)
+            last_active = self.conn.execute("HGET", key, "last_active")
+            if last_active is not None and float(last_active) >= limit:
+                self.conn.execute("UNWATCH")
+                return False
+            self.conn.execute("MULTI")
+            self.conn.execute("DEL", key)
+            self.conn.execute("ZREM", "games:active", game_id)
+            self.conn.execute("ZREM", "games:waiting", game_id)
+            # nil: written meanwhile, so active again
+            return self.conn.execute("EXEC") is not None
+
+    def waiting(self):
+        return [gid.decode() for gid in self.conn.execute("ZRANGE", "games:waiting", 0, -1)]
+
+    def expire(self, limit):
+        ids = [gid.decode() for gid in self.conn.execute("ZRANGEBYSCORE", "games:active", "-inf", f"({limit!r}")]
+        for game_id in ids:
+            self.delete(game_id)
+        return ids
+
+    def close(self):
+        self.conn.close()
+
+
+def open_store(url):
+    """Build the store described by a GAME_STORE value."""
+    if not url or url == "memory":
+        return MemoryStore()
+    parsed = urlparse(url)
+    if parsed.scheme == "sqlite":
+        return SQLiteStore(parsed.path if parsed.netloc == "" else parsed.netloc + parsed.path)
+    if parsed.scheme == "redis":
+        db = int(parsed.path.lstrip("/") or 0)
+        return RedisStore(parsed.hostname or "localhost", parsed.port or 6379, db)
+    raise ValueError(f"Unknown game store: {url}")
@@ -0,0 +1,103 @@
+import sqlite3
+import threading
+from datetime import datetime
+
+import pytest
+
+import database
+from database import ScoreStore
+
+
+def test_scores_are_batched_and_visible(tmp_path):
+    store = ScoreStore(str(tmp_path / "scores.db"))
+    store.init_db()
+    threads = [
+        threading.Thread(target=store.add_score, args=(f"p{i}", i * 10, 0, 1))
+        for i in range(50)
+    ]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    top = store.get_leaderboard(3)
+    assert [r["player_name"] for r in top] == ["p49", "p48", "p47"]
+    writer = store.writer
+    assert writer.rows == 50 and writer.batches < 50
+    store.close()
+
+
+def test_durable_mode_commits_before_returning(tmp_path):
+    store = ScoreStore(str(tmp_path / "scores.db"), durable=True)
+    store.init_db()
+    store.add_score("alice", 5000, 0, 1)
+    assert store.writer.pending == 0
+    assert store.get_leaderboard()[0]["player_name"] == "alice"
+    store.close()
+
+
+def test_top_cache_matches_indexed_query(tmp_path):
+    store = ScoreStore(str(tmp_path / "scores.db"))
+    store.init_db()
+    store.add_score("early", 3000, 0, 1)
+    assert store.get_leaderboard(1)[0]["player_name"] == "early" # loads the cache
+    for i, (blue, orange) in enumerate([(1000, 0), (0, 7000), (3000, 3000), (500, 200)]):
+        store.add_score(f"p{i}", blue, orange, 1)
+    cached = store.get_leaderboard(10)
+    assert cached == store._query_leaderboard(10)
+    assert cached[0]["player_name"] == "p1" and len(cached) == 5
+    with store.pool.connection() as conn:
+        plan = " ".join(r[-1] for r in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT player_name, score_blue, score_orange, winner, date "
+            "FROM leaderboard ORDER BY best_score DESC, date DESC LIMIT 10"))
+    assert "COVERING INDEX idx_leaderboard_best" in plan and "TEMP B-TREE" not in plan
+    store.close()
+
+
+def test_writer_survives_a_failed_batch(tmp_path):
+    store = ScoreStore(str(tmp_path / "scores.db"), durable=True)
+    store.init_db()
+    store.add_score("alice", 1000, 0, 1)
+    assert store.get_leaderboard(1)[0]["player_name"] == "alice" # loads the cache
+    with pytest.raises(sqlite3.IntegrityError):
+        store.add_score(None, 9000, 0, 1) # NOT NULL violation
+    assert store.writer.is_alive() and store.writer.failed == 1
+    # The failed row is not served from the cache, later scores still get through
+    store.add_score("bob", 2000, 0, 1)
+    assert [r["player_name"] for r in store.get_leaderboard(5)] == ["bob", "alice"]
+    store.close()
+
+
+def test_top_cache_ties_and_other_writers(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "LEADERBOARD_CACHE_SIZE", 2)
+    monkeypatch.setattr(database, "LEADERBOARD_CACHE_TTL", 60)
+    monkeypatch.setattr(database, "datetime", _Clock)
+    store = ScoreStore(str(tmp_path / "scores.db"), durable=True)
+    store.init_db()
+    _Clock.at = datetime(2100, 1, 1)
+    store.add_score("a", 1000, 0, 1)
+    _Clock.at = datetime(2100, 1, 2)
+    store.add_score("b", 1000, 0, 1)
+    store.get_leaderboard(2) # loads the cache
+    # Same best score, older date: it stays out
+    _Clock.at = datetime(2099, 1, 1)
+    store.add_score("old", 1000, 0, 1)
+    assert [r["player_name"] for r in store.get_leaderboard(2)] == ["b", "a"]
+    # Same best score, newer date: it goes first and pushes the oldest out
+    _Clock.at = datetime(2100, 1, 3)
+    store.add_score("c", 1000, 0, 1)
+    assert [r["player_name"] for r in store.get_leaderboard(2)] == ["c", "b"] == \
+        [r["player_name"] for r in store._query_leaderboard(2)]
+    # Another worker's score shows up once the cache expires
+    other = ScoreStore(str(tmp_path / "scores.db"), durable=True)
+    other.add_score("d", 9000, 0, 1)
+    assert store.get_leaderboard(1)[0]["player_name"] == "c"
+    monkeypatch.setattr(database, "LEADERBOARD_CACHE_TTL", 0)
+    assert store.get_leaderboard(1)[0]["player_name"] == "d"
+    other.close()
+    store.close()
+
+
+class _Clock:
+    at = None
+
+    @classmethod
+    def now(cls):
+        return cls.at
@@ -0,0 +1,384 @@
+import json
+import random
+import time
+
+import pytest
+
+import batch
+import game as game_module
+import book as book_module
+from arena import run_match
+from bitboard import Bitboard, EMPTY, WHITE, BLACK, coords, iter_bits, other, square
+from game import Game, PHASE_MOVEMENT
+from perft import perft, perft_reference, load_fixtures, position, board_rows
+from search import Searcher, TranspositionTable
+
+
+def random_rows(rng, n_pieces):
+    rows = [[EMPTY] * 9 for _ in range(9)]
+    for i, sq in enumerate(rng.sample(range(81), n_pieces)):
+        x, y = coords(sq)
+        rows[x][y] = WHITE if i % 2 == 0 else BLACK
+    return rows
+
+
+def test_rows_round_trip():
+    rng = random.Random(0)
+    for _ in range(50):
+        rows = random_rows(rng, rng.randint(0, 60))
+        assert Bitboard.from_rows(rows).to_rows() == rows
+
+
+def test_make_unmake_restores_position():
+    rng = random.Random(1)
+    for _ in range(50):
+        bb = Bitboard.from_rows(random_rows(rng, 30))
+        before = bb.snapshot()
+        for player in (WHITE, BLACK):
+            for f, t in bb.moves(player):
+                caps = bb.make_move(player, f, t)
+                bb.unmake_move(player, f, t, caps)
+                assert bb.snapshot() == before
+
+
+def test_capture_needs_three_neighbours():
+    rows = [[EMPTY] * 9 for _ in range(9)]
+    rows[4][4] = BLACK
+    rows[3][3] = WHITE
+    rows[3][4] = WHITE
+    rows[5][6] = WHITE
+    g = Game()
+    g.board = rows
+    g.phase = PHASE_MOVEMENT
+    # Two attackers only: nothing is captured yet
+    assert g.check_capture(3, 4, WHITE) == []
+    res = g.move_piece(5, 6, 5, 5)
+    assert res["captured"] == [(4, 4)]
+    assert g.board[4][4] == EMPTY
+
+
+def bfs_destinations(rows, x, y):
+    """The original nested-loop 1-2 step walk through empty cells."""
+    out = set()
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            nx, ny = x + dx, y + dy
+            if (dx or dy) and 0 <= nx < 9 and 0 <= ny < 9 and rows[nx][ny] == EMPTY:
+                out.add((nx, ny))
+                for ex in (-1, 0, 1):
+                    for ey in (-1, 0, 1):
+                        mx, my = nx + ex, ny + ey
+                        if (ex or ey) and 0 <= mx < 9 and 0 <= my < 9 and rows[mx][my] == EMPTY:
+                            out.add((mx, my))
+    return out
+
+
+def test_move_generation_matches_destinations():
+    rng = random.Random(2)
+    rows = random_rows(rng, 20)
+    bb = Bitboard.from_rows(rows)
+    g = Game()
+    g.board = rows
+    for player in (WHITE, BLACK):
+        by_piece = {}
+        for f, t in bb.moves(player):
+            by_piece.setdefault(f, set()).add(t)
+        for f in iter_bits(bb.pieces[player]):
+            assert by_piece.get(f, set()) == set(iter_bits(bb.destinations(f)))
+            assert set(g.valid_destinations(*coords(f))) == bfs_destinations(rows, *coords(f))
+    cached = g.legal_moves()
+    assert g.legal_moves() is cached
+    g.current = BLACK if g.current == WHITE else WHITE
+    g.event_id += 1
+    assert g.legal_moves() is not cached
+    assert g.valid_destinations(9, 0) == [] and g.valid_destinations(*coords(next(iter_bits(bb.empty())))) == []
+
+
+def plain_quiesce(bb, side, root, qdepth):
+    stand_pat = bb.evaluate(root)
+    if qdepth == 0 or bb.winner():
+        return stand_pat
+    scores = [stand_pat]
+    for f, t in bb.capture_moves(side):
+        caps = bb.make_move(side, f, t)
+        scores.append(plain_quiesce(bb, other(side), root, qdepth - 1))
+        bb.unmake_move(side, f, t, caps)
+    return max(scores) if side == root else min(scores)
+
+
+def plain_minimax(bb, depth, side, root, qdepth=0):
+    if bb.winner():
+        return bb.evaluate(root)
+    if depth == 0:
+        return plain_quiesce(bb, side, root, qdepth)
+    moves = bb.moves(side)
+    if not moves:
+        return bb.evaluate(root)
+    scores = []
+    for f, t in moves:
+        caps = bb.make_move(side, f, t)
+        scores.append(plain_minimax(bb, depth - 1, other(side), root, qdepth))
+        bb.unmake_move(side, f, t, caps)
+    return max(scores) if side == root else min(scores)
+
+
+def test_search_with_transposition_table_matches_plain_minimax():
+    rng = random.Random(3)
+    tt = TranspositionTable(1 << 12)
+    for _ in range(2):
+        bb = Bitboard.from_rows(random_rows(rng, 8))
+        hash_before = bb.hash
+        move, score = Searcher(WHITE, tt, quiescence=0).search(bb, 3)
+        assert score == plain_minimax(bb, 3, WHITE, WHITE)
+        assert bb.hash == hash_before
+        # Searching again is answered from the table
+        hits = tt.hits
+        assert Searcher(WHITE, tt, quiescence=0).search(bb, 3) == (move, score)
+        assert tt.hits > hits
+
+
+def test_quiescence_and_aspiration_keep_the_search_exact():
+    rng = random.Random(25)
+    changed = 0
+    for _ in range(4):
+        bb = Bitboard.from_rows(random_rows(rng, 20))
+        _, score = Searcher(WHITE, TranspositionTable(1 << 12), quiescence=3).search(bb, 1)
+        assert score == plain_minimax(bb, 1, WHITE, WHITE, 3)
+        changed += score != plain_minimax(bb, 1, WHITE, WHITE)
+    # Some of these leaves sit in the middle of an exchange
+    assert changed
+    for _ in range(20):
+        bb = Bitboard.from_rows(random_rows(rng, rng.randint(10, 40)))
+        for side in (WHITE, BLACK):
+            assert sorted(bb.capture_moves(side)) == sorted(m for m in bb.moves(side) if bb.move_captures(side, *m))
+    bb = Bitboard.from_rows(random_rows(rng, 16))
+    _, full = Searcher(WHITE, TranspositionTable(1 << 12)).search(bb, 2)
+    # A window that misses the score on either side falls back to the full window
+    for guess in (full - 5000, full, full + 5000):
+        s = Searcher(WHITE, TranspositionTable(1 << 12), aspiration=150)
+        assert s.search_aspirated(bb, 2, (), guess)[1] == full
+
+
+class LocalAlpha:
+    """SharedAlpha without the manager process."""
+    def __init__(self):
+        self.value = float("-inf")
+
+    def get(self):
+        return self.value
+
+    def raise_to(self, score):
+        self.value = max(self.value, score)
+
+
+def test_root_split_reports_which_scores_are_exact():
+    rng = random.Random(7)
+    bb = Bitboard.from_rows(random_rows(rng, 10))
+    best, score = Searcher(WHITE, TranspositionTable(1 << 12), quiescence=0).search(bb, 2)
+    moves = bb.moves(WHITE)
+    # Two workers: the best move's slice is searched first and raises the shared alpha
+    shared = LocalAlpha()
+    first = Searcher(WHITE, TranspositionTable(1 << 12), quiescence=0)
+    first.search_root(bb, 2, (), [best], shared)
+    rest = Searcher(WHITE, TranspositionTable(1 << 12), quiescence=0)
+    rest.search_root(bb, 2, (), [m for m in moves if m != best], shared)
+    assert first.root_exact == {best} and first.root_scores[best] == score
+    # Everything else failed low: bounds, possibly equal to the best score
+    assert not rest.root_exact and max(rest.root_scores.values()) <= score
+
+
+def assert_same_state(bb):
+    fresh = Bitboard(bb.pieces[WHITE], bb.pieces[BLACK])
+    assert bb.hash == fresh.hash
+    assert bb.counts == fresh.counts
+    assert bb.adj == fresh.adj
+    assert bb.danger == fresh.danger
+    assert bb.center == fresh.center
+
+
+def test_move_ordering_saves_nodes_without_changing_the_result():
+    rng = random.Random(11)
+    totals = {"full": 0, "no_killers": 0, "off": 0}
+    for _ in range(3):
+        bb = Bitboard.from_rows(random_rows(rng, 16))
+        results = {}
+        for mode in totals:
+            s = Searcher(WHITE, TranspositionTable(1 << 14), quiescence=0)
+            if mode != "full": s.record_cutoff = lambda *args: None # no killers, no history
+            if mode == "off": s.order_moves = lambda *args: None # generation order
+            results[mode] = s.iterative_deepening(bb, 3)
+            totals[mode] += s.nodes
+        assert results["full"] == results["no_killers"] == results["off"]
+    assert totals["full"] < totals["no_killers"] < totals["off"]
+    assert totals["full"] * 3 < totals["off"]
+
+
+def test_incremental_state_matches_fresh_board():
+    rng = random.Random(4)
+    bb = Bitboard.from_rows(random_rows(rng, 40))
+    side = WHITE
+    undo = []
+    # Play a random line with captures, then take it all back
+    for _ in range(60):
+        moves = bb.moves(side)
+        if not moves or bb.winner():
+            break
+        f, t = rng.choice(moves)
+        assert bb.move_captures(side, f, t) == bb.copy().make_move(side, f, t)
+        undo.append((side, f, t, bb.make_move(side, f, t)))
+        assert_same_state(bb)
+        side = other(side)
+    for side, f, t, caps in reversed(undo):
+        bb.unmake_move(side, f, t, caps)
+        assert_same_state(bb)
+
+
+def test_iterative_deepening_respects_budgets():
+    g = Game()
+    random.seed(5)
+    g.setup_fast_mode()
+    s = Searcher(WHITE, TranspositionTable(1 << 12))
+    start = time.perf_counter()
+    move, score, depth = s.iterative_deepening(g.bb.copy(), 10, time_budget=0.3)
+    assert time.perf_counter() - start < 0.6
+    assert move in g.bb.moves(WHITE)
+    assert depth >= 1 and s.pv[0] == move
+
+    s = Searcher(WHITE, TranspositionTable(1 << 12))
+    move, score, depth = s.iterative_deepening(g.bb.copy(), 10, node_budget=2000)
+    assert move is not None and s.nodes <= 2000 + len(g.bb.moves(WHITE))
+
+    # Long capture sequences: quiescence runs under the budget too
+    for seed in (44, 69):
+        random.seed(seed)
+        g = Game()
+        g.setup_fast_mode()
+        s = Searcher(BLACK, TranspositionTable(1 << 12), quiescence=4)
+        start = time.perf_counter()
+        move, score, depth = s.iterative_deepening(g.bb.copy(), 10, time_budget=0.05)
+        assert time.perf_counter() - start < 0.3
+        assert move in g.bb.moves(BLACK)
+
+
+def test_delta_state_falls_back_to_snapshot():
+    g = Game()
+    g.play(0, 0)
+    g.play(8, 8)
+    g.play(0, 1)
+    delta = g.get_delta(1)
+    assert delta["delta"] and [e["id"] for e in delta["events"]] == [2, 3]
+    assert g.get_delta(3)["events"] == []
+    g.reset()
+    # The log was cleared by the reset: old clients get the full board
+    full = g.get_delta(3)
+    assert full["delta"] is False and full["last_event"]["type"] == "reset"
+    assert full["board"][0][0] == EMPTY
+
+
+def test_binary_snapshot_round_trip():
+    random.seed(14)
+    g = Game()
+    g.setup_fast_mode()
+    while g.check_winner() is None and not any(e["captured"] for e in g.events):
+        m = random.choice(g._get_all_moves(g.current))
+        g.move_piece(*m["from"], *m["to"])
+    data = g.to_bytes()
+    copy = Game.from_bytes(data)
+    # Same JSON (captured squares come back as tuples, the score in WHITE, BLACK order)
+    assert json.dumps(copy.get_state(), sort_keys=True) == json.dumps(g.get_state(), sort_keys=True)
+    assert copy.get_delta(0) == g.get_delta(0)
+    assert list(copy.recent_positions) == list(g.recent_positions)
+    assert len(data) == 63 + 22 * len(g.recent_positions) + 8 * len(g.events)
+    assert Game.from_bytes(g.to_bytes(events=False)).get_delta(0)["delta"] is False
+
+
+def test_arena_is_reproducible():
+    first = run_match("novice", "initie", 4, seed=3)
+    again = run_match("novice", "initie", 4, seed=3)
+    assert first["levels"]["initie"]["win_rate"] == again["levels"]["initie"]["win_rate"]
+    assert first["levels"]["initie"]["moves"] == again["levels"]["initie"]["moves"]
+    assert first["levels"]["novice"]["avg_move_ms"] > 0
+
+
+def test_perft_matches_fixtures_and_reference_generator():
+    for fixture in load_fixtures():
+        bb, side = position(fixture)
+        assert [perft(bb, side, d) for d in (1, 2)] == fixture["counts"][:2], fixture["name"]
+    for name in ("capture", "endgame"):
+        fixture = next(f for f in load_fixtures() if f["name"] == name)
+        assert perft_reference(board_rows(fixture), fixture["side"], 2) == fixture["counts"][1]
+
+
+def test_book_answers_under_every_symmetry(tmp_path):
+    rng = random.Random(20)
+    bb = Bitboard.from_rows(random_rows(rng, 8))
+    f, t = bb.moves(WHITE)[0]
+    entries = {}
+    book_module._add(entries, bb, WHITE, (f, t), 123)
+    book_module._add(entries, Bitboard(), WHITE, square(4, 4), 0, placement=True)
+    path = str(tmp_path / "book.bin")
+    book_module.write_book(path, entries)
+    book = book_module.Book(path)
+    assert book.count == 9
+    for sym in book_module.SYMMETRIES:
+        image = Bitboard(sum(1 << sym[sq] for sq in iter_bits(bb.pieces[WHITE])),
+                         sum(1 << sym[sq] for sq in iter_bits(bb.pieces[BLACK])))
+        assert book.probe(image, WHITE) == (sym[f], sym[t])
+    assert book.probe(bb, BLACK) is None
+    assert book.probe(Bitboard(), WHITE, placement=True) == square(4, 4)
+    assert book.probe(Bitboard(), WHITE) is None
+
+
+@pytest.mark.skipif(not batch.AVAILABLE, reason="numpy not installed")
+def test_batched_scores_match_bitboard():
+    rng = random.Random(21)
+    for _ in range(20):
+        bb = Bitboard.from_rows(random_rows(rng, rng.randint(6, 40)))
+        for player in (WHITE, BLACK):
+            moves, captured, scores = batch.score_moves(bb, player)
+            for (f, t), n, score in zip(moves, captured, scores):
+                caps = bb.make_move(player, f, t)
+                assert n == caps.bit_count() and score == bb.evaluate(player)
+                bb.unmake_move(player, f, t, caps)
+
+
+def test_initie_takes_the_most_pieces_and_breaks_ties_at_random():
+    random.seed(21)
+    g = Game()
+    g.setup_fast_mode()
+    g.ai_difficulty = "initie"
+    moves = g.bb.moves(g.current)
+    most = max(g.bb.move_captures(g.current, *m).bit_count() for m in moves)
+    picked = set()
+    for seed in range(20):
+        random.seed(seed)
+        mv = g.ai_move(g.current)
+        f, t = square(*mv["from"]), square(*mv["to"])
+        assert g.bb.move_captures(g.current, f, t).bit_count() == most
+        picked.add((f, t))
+    assert len(picked) > 1
+
+
+def test_mcts_keeps_its_subtree_across_turns(monkeypatch):
+    monkeypatch.setattr(game_module, "MCTS_TIME_BUDGET", 0)
+    monkeypatch.setattr(game_module, "MCTS_ITERATIONS", 400)
+    random.seed(23)
+    game = Game()
+    game.setup_fast_mode()
+    game.ai_difficulty = "mcts"
+    mv = game.ai_move(WHITE)
+    assert game.last_search["nodes"] == 400 and game.last_search["reused"] == 0
+    game.move_piece(*mv["from"], *mv["to"])
+    # The opponent answers with the reply the tree explored most
+    reply = max(game.mcts.root.children, key=lambda c: c.visits)
+    explored = reply.visits
+    game.move_piece(*coords(reply.move[0]), *coords(reply.move[1]))
+    assert game.mcts.root is reply
+    game.ai_move(WHITE)
+    assert game.last_search["reused"] == explored > 0
+    assert Game.from_bytes(game.to_bytes()).ai_difficulty == "mcts"
+    # A position outside the tree starts a new one
+    game.reset()
+    game.ai_difficulty = "mcts"
+    game.ai_move(WHITE)
+    assert game.last_search["reused"] == 0
@@ -0,0 +1,34 @@
+import os
+import tempfile
+
+from fastapi.testclient import TestClient
+
+import database
+from bitboard import coords
+
+# main opens the scores database on import: keep the tests off the real one
+database.store = database.ScoreStore(os.path.join(tempfile.mkdtemp(), "scores.db"))
+import main
+
+
+def test_sockets_push_moves_and_lobby_changes():
+    with TestClient(main.app) as client:
+        with client.websocket_connect("/ws/lobby") as lobby:
+            assert lobby.receive_json() == {"type": "lobby", "games": main.manager.list_waiting_games()}
+            gid = client.post("/games/create", params={"type": "multi", "is_fast": True}).json()["game_id"]
+            assert gid in lobby.receive_json()["games"]
+            client.post(f"/games/join/{gid}")
+            assert gid in lobby.receive_json()["games"] # one player so far
+            client.post(f"/games/join/{gid}")
+            assert gid not in lobby.receive_json()["games"]
+
+        with client.websocket_connect(f"/ws/games/{gid}") as socket:
+            initial = socket.receive_json()
+            assert initial["type"] == "state" and initial["game_id"] == gid
+            game = main.manager.get_game(gid)
+            f, t = game.bb.moves(game.current)[0]
+            (fx, fy), (tx, ty) = coords(f), coords(t)
+            client.post("/move", params={"game_id": gid, "fx": fx, "fy": fy, "tx": tx, "ty": ty})
+            pushed = socket.receive_json()["state"]
+            assert pushed["event_id"] == initial["state"]["event_id"] + 1
+            assert pushed["board"][tx][ty] == initial["state"]["current"]
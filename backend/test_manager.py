@@ -0,0 +1,110 @@
+import asyncio
+import json
+import threading
+import time
+
+from game import Game
+from manager import GameManager
+from movelog import MoveLog
+from store import MemoryStore
+
+
+def test_waiting_index_follows_joins():
+    m = GameManager()
+    solo = m.create_game("solo")
+    multi = m.create_game("multi")
+    assert m.list_waiting_games() == [multi]
+    assert m.join_game(multi)
+    assert m.join_game(multi)
+    assert m.list_waiting_games() == []
+    assert not m.join_game(multi)
+    assert not m.join_game(solo)
+
+
+def test_cleanup_expires_only_idle_games():
+    m = GameManager()
+    m.cleanup_threshold = 10
+    idle = m.create_game("multi")
+    active = m.create_game("solo")
+    expired = []
+    m.add_listener(lambda kind, gid: expired.append(gid) if kind == "expired" else None)
+    now = time.time()
+    # Touched recently: requeued instead of dropped
+    m.get_entry(active)["last_active"] = now + 15
+    assert m.cleanup(now=now + 20) == 1
+    assert expired == [idle]
+    assert m.get_game(idle) is None
+    assert m.get_game(active) is not None
+    assert m.list_waiting_games() == []
+    assert m.count() == 1
+
+
+def test_expiry_task_runs_off_the_loop_and_survives_errors():
+    m = GameManager()
+    threads = []
+
+    def cleanup():
+        threads.append(threading.current_thread())
+        if len(threads) == 1:
+            raise ConnectionError("store down")
+
+    m.cleanup = cleanup
+
+    async def run():
+        task = asyncio.ensure_future(m.expire_forever(0.01))
+        await asyncio.sleep(0.1)
+        task.cancel()
+
+    asyncio.run(run())
+    assert len(threads) >= 2 and threading.main_thread() not in threads
+
+
+def test_listeners_see_lobby_changes():
+    m = GameManager()
+    seen = []
+    m.add_listener(lambda kind, gid: seen.append(kind))
+    gid = m.create_game("multi")
+    m.get_game(gid).play(0, 0)
+    m.join_game(gid)
+    assert seen == ["lobby", "game", "lobby"]
+
+
+def test_move_log_recovers_games_after_a_crash(tmp_path):
+    m = GameManager(store=MemoryStore(), log=MoveLog(str(tmp_path), snapshot_every=4))
+    gid = m.create_game("multi")
+    m.join_game(gid)
+    game = m.get_game(gid)
+    for i in range(10):
+        game.play(i % 9, i // 9)
+    history = m.log.history(gid)
+    assert [e["id"] for e in history] == list(range(1, 11))
+    assert Game().replay([(e["x"], e["y"]) for e in history]).board == game.board
+    # Crash: a half-written record at the end of the segment, a new process with an empty store
+    m.log.close()
+    segment = tmp_path / sorted(p.name for p in tmp_path.iterdir())[-1]
+    segment.write_bytes(segment.read_bytes() + b"\x08\x00\x02")
+    fresh = GameManager(store=MemoryStore(), log=MoveLog(str(tmp_path)))
+    assert fresh.recover() == 1
+    restored = fresh.get_game(gid)
+    assert json.dumps(restored.get_state()) == json.dumps(game.get_state())
+    assert fresh.get_entry(gid)["players"] == 1
+    assert fresh.log.history(gid) == history
+    # Restored games expire like the others, and their segments go with them
+    fresh.cleanup_threshold = 10
+    assert fresh.cleanup(now=time.time() + 20) == 1 and fresh.log.games == {}
+    fresh.log.close()
+    assert MoveLog(str(tmp_path)).load() == 0
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_compaction_keeps_forgotten_games_forgotten(tmp_path):
+    log = MoveLog(str(tmp_path))
+    log.snapshot("a", Game())
+    log.snapshot("b", Game())
+    log._roll()
+    log.forget("b")
+    log.close()
+    # The segment with "b"'s FORGET goes, the one with "a" stays
+    assert MoveLog(str(tmp_path)).load() == 1
+    reloaded = MoveLog(str(tmp_path))
+    assert reloaded.load() == 1 and list(reloaded.games) == ["a"]
@@ -0,0 +1,181 @@
+import asyncio
+import random
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import game as game_module
+from ai_pool import AIPool
+from bitboard import coords
+from game import Game
+from ponder import Ponderer, likely_replies
+from scheduler import AIScheduler
+
+
+def fast_game(level):
+    random.seed(22)
+    game = Game()
+    game.setup_fast_mode()
+    game.ai_difficulty = level
+    return game
+
+
+def test_pool_searches_in_a_worker_and_reports_its_table(monkeypatch):
+    monkeypatch.setenv("AI_TIME_BUDGET", "0.2") # read by the spawned worker
+    pool = AIPool(workers=1, timeout=30)
+    game = fast_game("expert")
+    try:
+        move = asyncio.run(pool.search(game, 1))
+    finally:
+        pool.shutdown()
+    assert move is not None and game.last_search["nodes"] > 0
+    table = pool.table_stats()
+    assert table["workers"] == 1 and table["hits"] + table["misses"] > 0
+
+
+class BrokenExecutor:
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_exception(BrokenProcessPool("worker died"))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+def test_pool_falls_back_to_the_greedy_move(monkeypatch):
+    monkeypatch.setattr(game_module, "EXPERT_MAX_DEPTH", 5)
+    monkeypatch.setattr(game_module, "EXPERT_TIME_BUDGET", 0.5)
+    # Timeout: the search is still running when the deadline comes
+    game = fast_game("expert")
+
+    async def timed():
+        start = time.perf_counter()
+        move = await AIPool(workers=0).search(game, 1, timeout=0.05)
+        return move, time.perf_counter() - start
+
+    move, waited = asyncio.run(timed())
+    assert move is not None and waited < 0.3
+    assert game.ai_difficulty == "expert"
+    # Dead worker: greedy move, and the executor is dropped to be recreated
+    pool = AIPool(workers=1)
+    pool._executor = BrokenExecutor()
+    assert asyncio.run(pool.search(fast_game("expert"), 1)) is not None
+    assert pool._executor is None
+
+
+def test_cheap_levels_do_not_wait_behind_searches(monkeypatch):
+    monkeypatch.setattr(game_module, "EXPERT_MAX_DEPTH", 5)
+    monkeypatch.setattr(game_module, "EXPERT_TIME_BUDGET", 0.3)
+    scheduler = AIScheduler(AIPool(workers=0, timeout=5), slots=1)
+
+    async def run():
+        experts = [asyncio.ensure_future(scheduler.ai_move(fast_game("expert"), 1)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert scheduler.stats()["queued"] == 2 and scheduler.stats()["running"] == 1
+        start = time.perf_counter()
+        cheap = await scheduler.ai_move(fast_game("initie"), 1)
+        cheap_time = time.perf_counter() - start
+        return cheap, cheap_time, await asyncio.gather(*experts)
+
+    cheap, cheap_time, moves = asyncio.run(run())
+    assert cheap is not None and cheap_time < 0.2
+    assert all(m is not None for m in moves)
+    levels = scheduler.stats()["levels"]
+    assert levels["expert"]["served"] == 3 and levels["expert"]["queued"] == 0
+    # The last expert waited for the two searches before it
+    assert levels["expert"]["max_wait_ms"] >= 400
+    assert levels["initie"]["max_wait_ms"] == 0
+
+
+def test_queued_request_gets_greedy_move_at_its_deadline(monkeypatch):
+    monkeypatch.setattr(game_module, "EXPERT_MAX_DEPTH", 5)
+    monkeypatch.setattr(game_module, "EXPERT_TIME_BUDGET", 0.3)
+    scheduler = AIScheduler(AIPool(workers=0, timeout=5), slots=1)
+
+    async def run():
+        first = asyncio.ensure_future(scheduler.ai_move(fast_game("expert"), 1))
+        await asyncio.sleep(0)
+        start = time.perf_counter()
+        late = await scheduler.ai_move(fast_game("expert"), 1, timeout=0.05)
+        return late, time.perf_counter() - start, await first
+
+    late, waited, first = asyncio.run(run())
+    assert late is not None and first is not None
+    assert waited < 0.25
+    assert scheduler.stats()["levels"]["expert"]["expired"] == 1
+
+
+def test_pondered_reply_is_answered_from_the_cache(monkeypatch):
+    monkeypatch.setattr(game_module, "EXPERT_MAX_DEPTH", 2)
+    monkeypatch.setattr(game_module, "EXPERT_TIME_BUDGET", 0)
+    ponderer = Ponderer(AIScheduler(AIPool(workers=0, timeout=5), slots=2), enabled=True, replies=3)
+    game = fast_game("expert")
+
+    async def run():
+        ponderer.start("g1", game, 2)
+        await ponderer.tasks["g1"]
+        assert ponderer.searched == 3 and len(ponderer.cache) == 3
+        # The human plays the most likely reply: the answer is already there
+        f, t = likely_replies(game.bb, 1)[0]
+        game.move_piece(*coords(f), *coords(t))
+        hit = ponderer.lookup("g1", game, 2)
+        assert hit is not None and game.last_search["pondered"]
+        game.move_piece(*hit["from"], *hit["to"])
+        # Expired games stop pondering
+        ponderer.start("g1", game, 1)
+        ponderer.listener("expired", "g1")
+        await asyncio.sleep(0)
+        return ponderer.tasks
+
+    assert asyncio.run(run()) == {}
+    assert ponderer.hits == 1
+
+
+def test_pondering_leaves_a_slot_to_live_requests(monkeypatch):
+    monkeypatch.setattr(game_module, "EXPERT_MAX_DEPTH", 5)
+    monkeypatch.setattr(game_module, "EXPERT_TIME_BUDGET", 0.5)
+    scheduler = AIScheduler(AIPool(workers=0, timeout=5), slots=2)
+    ponderer = Ponderer(scheduler, enabled=True, replies=3)
+
+    async def run():
+        ponderer.start("g1", fast_game("expert"), 2)
+        ponderer.start("g2", fast_game("expert"), 2)
+        await asyncio.sleep(0.05)
+        assert scheduler.stats()["running"] == 1 and scheduler.stats()["queued"] == 1
+        # Stopped from threadpool threads, like /reset: the search already dispatched goes on
+        for game_id in ("g1", "g2"):
+            await asyncio.get_running_loop().run_in_executor(None, ponderer.stop, game_id)
+        await asyncio.sleep(0)
+        assert ponderer.tasks == {} and scheduler.stats()["running"] == 1
+        return await scheduler.ai_move(fast_game("expert"), 1)
+
+    assert asyncio.run(run()) is not None
+    assert scheduler.stats()["levels"]["expert"]["max_wait_ms"] < 50
+    # A single slot has none to spare: no pondering at all
+    single = Ponderer(AIScheduler(AIPool(workers=0), slots=1), enabled=True)
+
+    async def start():
+        single.start("g2", fast_game("expert"), 2)
+        return single.tasks
+
+    assert asyncio.run(start()) == {}
+
+
+def test_mcts_searches_have_their_own_slots(monkeypatch):
+    monkeypatch.setattr(game_module, "EXPERT_MAX_DEPTH", 5)
+    monkeypatch.setattr(game_module, "EXPERT_TIME_BUDGET", 0.3)
+    monkeypatch.setattr(game_module, "MCTS_TIME_BUDGET", 0.3)
+    scheduler = AIScheduler(AIPool(workers=0, timeout=5), slots=1, thread_slots=1)
+    reset = fast_game("mcts")
+
+    async def run():
+        requests = [asyncio.ensure_future(scheduler.ai_move(g, 1))
+                    for g in (reset, fast_game("mcts"), fast_game("expert"))]
+        await asyncio.sleep(0.1)
+        # One mcts search next to the expert one, the second mcts waits for its own slot
+        assert scheduler.stats()["running"] == 2 and scheduler.stats()["queued"] == 1
+        reset.reset() # drops the tree the running search works on
+        return await asyncio.gather(*requests)
+
+    assert all(m is not None for m in asyncio.run(run()))
@@ -0,0 +1,176 @@
+import socketserver
+import threading
+import time
+
+import pytest
+
+from manager import GameManager
+from store import MemoryStore, SQLiteStore, RedisStore, RedisConnection, VersionConflict
+
+
+class MiniRedis(socketserver.ThreadingTCPServer):
+    """Local stand-in speaking enough of the Redis protocol for RedisStore."""
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _RedisHandler)
+        self.data = {}
+        self.revisions = {} # key -> write counter, for WATCH
+        self.lock = threading.Lock()
+
+
+class _RedisHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.watched, self.queued = {}, None
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                n = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(n + 2)[:-2])
+            self.wfile.write(self.dispatch(args[0].decode().upper(), args[1:]))
+
+    def dispatch(self, cmd, args):
+        srv = self.server
+        if cmd == "MULTI":
+            self.queued = []
+            return b"+OK\r\n"
+        if self.queued is not None and cmd != "EXEC":
+            self.queued.append((cmd, args))
+            return b"+QUEUED\r\n"
+        if cmd == "DEBUG": # DEBUG SLEEP seconds, without holding up the other connections
+            time.sleep(float(args[1]))
+            return b"+OK\r\n"
+        with srv.lock:
+            if cmd == "WATCH":
+                self.watched.update({k: srv.revisions.get(k, 0) for k in args})
+                return b"+OK\r\n"
+            if cmd == "UNWATCH":
+                self.watched = {}
+                return b"+OK\r\n"
+            if cmd == "EXEC":
+                queued, self.queued = self.queued, None
+                stale = any(srv.revisions.get(k, 0) != v for k, v in self.watched.items())
+                self.watched = {}
+                if stale:
+                    return b"*-1\r\n"
+                return b"*%d\r\n" % len(queued) + b"".join(self.run(c, a) for c, a in queued)
+            return self.run(cmd, args)
+
+    def run(self, cmd, args):
+        data = self.server.data
+        if cmd in ("HSET", "ZADD", "ZREM", "DEL"):
+            self.server.revisions[args[0]] = self.server.revisions.get(args[0], 0) + 1
+        if cmd == "HGET":
+            return _bulk(data.get(args[0], {}).get(args[1]))
+        if cmd == "HGETALL":
+            fields = data.get(args[0], {})
+            return _array([x for kv in fields.items() for x in kv])
+        if cmd == "HSET":
+            data.setdefault(args[0], {}).update(zip(args[1::2], args[2::2]))
+            return b":1\r\n"
+        if cmd == "DEL":
+            return b":%d\r\n" % (data.pop(args[0], None) is not None)
+        if cmd == "ZADD":
+            data.setdefault(args[0], {})[args[2]] = float(args[1])
+            return b":1\r\n"
+        if cmd == "ZREM":
+            return b":%d\r\n" % (data.get(args[0], {}).pop(args[1], None) is not None)
+        if cmd == "ZRANGE":
+            return _array(sorted(data.get(args[0], {}), key=data.get(args[0], {}).get))
+        if cmd == "ZRANGEBYSCORE":
+            limit = float(args[2].lstrip(b"("))
+            zset = data.get(args[0], {})
+            return _array(sorted((m for m, s in zset.items() if s < limit), key=zset.get))
+        return b"-ERR unknown command\r\n"
+
+
+def _bulk(value):
+    return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def _array(items):
+    return b"*%d\r\n" % len(items) + b"".join(_bulk(i) for i in items)
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def store_factory(request, tmp_path):
+    """Returns a callable giving a new handle on one shared store (like another worker)."""
+    if request.param == "memory":
+        store = MemoryStore()
+        yield lambda: store
+    elif request.param == "sqlite":
+        yield lambda: SQLiteStore(str(tmp_path / "games.db"))
+    else:
+        server = MiniRedis()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        yield lambda: RedisStore(*server.server_address)
+        server.shutdown()
+
+
+def test_store_detects_concurrent_writes(store_factory):
+    store = store_factory()
+    record = {"data": b"x", "version": 1, "type": "multi", "players": 0, "last_active": 100.0}
+    store.save("g1", record, None)
+    assert store.waiting() == ["g1"]
+    with pytest.raises(VersionConflict):
+        store.save("g1", record, None)
+    store.save("g1", dict(record, version=2, players=2), 1)
+    with pytest.raises(VersionConflict):
+        store.save("g1", dict(record, version=3), 1)
+    assert store.load("g1")["version"] == 2 and store.version("g1") == 2
+    assert store.waiting() == []
+    store.delete("g1")
+    assert store.load("g1") is None
+
+
+def test_workers_share_games_through_the_store(store_factory):
+    a, b = GameManager(store=store_factory()), GameManager(store=store_factory())
+    gid = a.create_game("multi")
+    assert b.list_waiting_games() == [gid]
+    assert b.join_game(gid)
+    b.get_game(gid).play(4, 4)
+    # A's cached copy is stale: it reloads and sees B's move
+    stale = a._cached(gid)["game"]
+    game = a.get_game(gid)
+    assert game is not stale and game.board[4][4] == 1
+    # Playing on the stale copy must not overwrite B's move
+    with pytest.raises(VersionConflict):
+        stale.play(0, 0)
+    game.play(0, 1)
+    assert b.get_game(gid).event_id == 2
+
+
+def test_cleanup_keeps_games_played_on_another_worker(store_factory):
+    a, b = GameManager(store=store_factory()), GameManager(store=store_factory())
+    a.cleanup_threshold = 0.1
+    gid = a.create_game("multi")
+    time.sleep(0.15)
+    # Idle in A's cache, but B just played it
+    b.join_game(gid)
+    b.get_game(gid).play(4, 4)
+    assert a.cleanup() == 0
+    assert b.get_game(gid) is not None and a.get_game(gid).board[4][4] == 1
+    time.sleep(0.15)
+    assert a.cleanup() == 1
+    assert b.get_game(gid) is None
+
+
+def test_redis_connection_parses_replies():
+    server = MiniRedis()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    conn = RedisConnection(*server.server_address)
+    assert conn.execute("HSET", "k", "f", b"\x00\r\n") == 1
+    assert conn.execute("HGET", "k", "f") == b"\x00\r\n"
+    assert conn.execute("HGET", "k", "nope") is None
+    conn.close()
+    # A reply late past the timeout is not taken for the next command's
+    conn = RedisConnection(*server.server_address, timeout=0.1)
+    with pytest.raises(OSError):
+        conn.execute("DEBUG", "SLEEP", 0.3)
+    assert conn.execute("HGET", "k", "f") == b"\x00\r\n"
+    conn.close()
+    server.shutdown()
@@ -3,6 +3,42 @@ import { useEffect, useState, useRef } from "react";
 import logo8 from "./assets/logo8.png";
 import Board from "./components/Board";
 
+// Keeps a WebSocket open: reconnects with exponential backoff after a close or
+// an error, and calls onReconnect once back so the caller refetches what it missed.
+// Returns a function closing it for good.
+function openSocket(url, onMessage, onReconnect) {
+  let ws = null;
+  let retry = null;
+  let delay = 1000;
+  let closed = false;
+  let dropped = false;
+
+  const connect = () => {
+    ws = new WebSocket(url);
+    ws.onopen = () => {
+      delay = 1000;
+      if (dropped) onReconnect();
+      dropped = false;
+    };
+    ws.onmessage = onMessage;
+    ws.onerror = () => ws.close();
+    ws.onclose = (e) => {
+      // 4404: the game is gone, retrying won't bring it back
+      if (closed || e.code === 4404) return;
+      dropped = true;
+      retry = setTimeout(connect, delay);
+      delay = Math.min(delay * 2, 30000);
+    };
+  };
+  connect();
+
+  return () => {
+    closed = true;
+    clearTimeout(retry);
+    ws.close();
+  };
+}
+
 function App() {
   const [board, setBoard] = useState([]);
   const [current, setCurrent] = useState(1);
@@ -36,7 +72,7 @@ function App() {
   const [isWaiting, setIsWaiting] = useState(false);
   const [processedEventId, setProcessedEventId] = useState(0);
   const [isFast, setIsFast] = useState(false);
-  const [aiDifficulty, setAiDifficulty] = useState("initie"); // 'novice', 'initie', 'expert'
+  const [aiDifficulty, setAiDifficulty] = useState("initie"); // 'novice', 'initie', 'expert', 'mcts'
   const [aiStatus, setAiStatus] = useState(null);
   const [moveCount, setMoveCount] = useState(0);
   const [maxPieces, setMaxPieces] = useState(6);
@@ -54,9 +90,12 @@ function App() {
   const logContainerRef = useRef(null);
   const audioCtxRef = useRef(null);
   const lastPhaseRef = useRef(null);
+  const pushedStateRef = useRef(null);
+  const [pushTick, setPushTick] = useState(0);
 
   const API_HOST = window.location.hostname;
   const API_URL = `http://${API_HOST}:8000`;
+  const WS_URL = `ws://${API_HOST}:8000`;
 
   useEffect(() => {
     const saved = sessionStorage.getItem("8tour_session");
@@ -242,23 +281,38 @@ function App() {
     fetchLeaderboard();
   }, []);
 
+  // Lobby: the server pushes the waiting games list whenever it changes (refetched after a reconnect)
   useEffect(() => {
     if (view === "lobby") {
       fetchWaitingGames();
-      const itv = setInterval(fetchWaitingGames, 3000);
-      return () => clearInterval(itv);
+      return openSocket(`${WS_URL}/ws/lobby`, (e) => {
+        const msg = JSON.parse(e.data);
+        setWaitingGames(msg.games || []);
+      }, fetchWaitingGames);
     }
   }, [view]);
 
-  // Polling for multiplayer sync
+  // Multiplayer sync: the server pushes the state after every move (refetched after a reconnect)
   useEffect(() => {
-    if (view === "game" && gameType === "multi" && current !== myPlayerId && !winner) {
-      const itv = setInterval(() => {
-        if (!isAnimating) fetchState();
-      }, 2000);
-      return () => clearInterval(itv);
+    if (view === "game" && gameType === "multi" && gameId) {
+      return openSocket(`${WS_URL}/ws/games/${gameId}`, (e) => {
+        const msg = JSON.parse(e.data);
+        if (msg.state) {
+          pushedStateRef.current = msg.state;
+          setPushTick(t => t + 1);
+        }
+      }, fetchState);
+    }
+  }, [view, gameType, gameId]);
+
+  // Apply the latest pushed state once the current animation is over
+  useEffect(() => {
+    if (!isAnimating && pushedStateRef.current) {
+      const data = pushedStateRef.current;
+      pushedStateRef.current = null;
+      handleFinalData(data);
     }
-  }, [view, gameType, current, myPlayerId, winner, gameId, isAnimating]);
+  }, [pushTick, isAnimating]);
 
   useEffect(() => {
     if (gameId && view === "game") {
@@ -634,6 +688,9 @@ function App() {
                 <button className={`btn-icon ${aiDifficulty === "expert" ? "active" : ""}`} onClick={() => setAiDifficulty("expert")} style={{ fontSize: "0.8rem", padding: "0.4rem 0.8rem", background: aiDifficulty === "expert" ? "rgba(239, 68, 68, 0.2)" : "transparent", opacity: aiDifficulty === "expert" ? 1 : 0.5, border: aiDifficulty === "expert" ? "1px solid #ef4444" : "1px solid var(--glass-border)" }}>
                   🔥 Expert
                 </button>
+                <button className={`btn-icon ${aiDifficulty === "mcts" ? "active" : ""}`} onClick={() => setAiDifficulty("mcts")} style={{ fontSize: "0.8rem", padding: "0.4rem 0.8rem", background: aiDifficulty === "mcts" ? "rgba(168, 85, 247, 0.2)" : "transparent", opacity: aiDifficulty === "mcts" ? 1 : 0.5, border: aiDifficulty === "mcts" ? "1px solid #a855f7" : "1px solid var(--glass-border)" }}>
+                  🌲 MCTS
+                </button>
               </div>
             </div>
 